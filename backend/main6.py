@@ -7,22 +7,27 @@ import zipfile
 import io
 import os
 from datetime import datetime
+# One copy shared with backend2, which owns it
+from backend2.db_setup import engine_options, install_sqlite_pragmas, describe_database
 
 app = Flask(__name__)
 # Keep your current working setup but make it explicit
 instance_path = os.path.join(os.path.dirname(__file__), 'instance')
 os.makedirs(instance_path, exist_ok=True)  # Ensure instance folder exists
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}'
+# DATABASE_URL switches to a server database; the SQLite default runs in WAL mode
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 # Print for verification
-print(f"Database path: {os.path.join(instance_path, 'db.sqlite3')}")
+print(f"Database path: {describe_database(app.config['SQLALCHEMY_DATABASE_URI'])}")
 CORS(app)
 
 # Import models AFTER app configuration
-from backend.models1 import db, ColumnMapping
+from backend.models1 import db, ColumnMapping, MappingVersion, MappingSet, ActiveMappingSet, upgrade_mapping_schema
 
 # Initialize db with app
+install_sqlite_pragmas()
 db.init_app(app)
 
 def format_date_for_column(data_series, column_name):
@@ -73,6 +78,7 @@ def create_tables():
     with app.app_context():
         try:
             db.create_all()
+            upgrade_mapping_schema()
             print("Database tables created successfully!")
             
             # Verify table creation
@@ -128,8 +134,9 @@ def get_latest_mappings():
         
         return mapping_dict
     except Exception as e:
+        # An empty dict would silently generate unmapped FBDI files
         print(f"Error getting latest mappings: {e}")
-        return {}
+        raise
 
 @app.route('/generate-fbdi-from-table', methods=['POST'])
 def generate_fbdi_from_table():
@@ -309,7 +316,9 @@ def generate_fbdi():
         # Check for special mappings
         has_buisness_unit_in_raw = "*Buisness Unit Name" in raw_columns
 
-        # Store mappings in database (keep all historical mappings)
+        # Store mappings in database (keep all historical mappings, one set per run)
+        mapping_set = MappingSet.start("AR", "RA_INTERFACE_LINES_ALL", source="generate-fbdi")
+        mapping_rows = []
         mappings_inserted = 0
         
         # Fill template from raw data
@@ -355,18 +364,22 @@ def generate_fbdi():
                 # No mapping found
                 print(f"✗ No mapping found for template column: {template_col}")
 
-            # Save mapping to database (excluding *Buisness Unit Name)
-            mapping = ColumnMapping(
+            # Queue mapping for the bulk insert (excluding *Buisness Unit Name)
+            mapping_rows.append(dict(
                 fbdi_module="AR",
                 fbdi_subset="RA_INTERFACE_LINES_ALL",
                 template_column=str(template_col),
                 raw_column=str(raw_col_name) if raw_col_name else "",
-                status=status
-            )
-            db.session.add(mapping)
+                status=status,
+                mapping_set_id=mapping_set.id
+            ))
             mappings_inserted += 1
 
-        # Commit all mappings to database
+        # Insert all mappings in one executemany and commit them as the active set,
+        # bumping the version readers cache against
+        db.session.bulk_insert_mappings(ColumnMapping, mapping_rows)
+        mapping_set.activate()
+        MappingVersion.bump()
         db.session.commit()
         print(f"✓ Inserted {mappings_inserted} column mappings into database")
 
@@ -433,7 +446,9 @@ def generate_mappings_only():
         # Check for special mappings
         has_buisness_unit_in_raw = "*Buisness Unit Name" in raw_columns
         
-        # Store mappings in database
+        # Store mappings in database as a new set
+        mapping_set = MappingSet.start("AR", "RA_INTERFACE_LINES_ALL", source="generate-mappings-only")
+        mapping_rows = []
         mappings_inserted = 0
         successful_mappings = 0
         failed_mappings = 0
@@ -472,18 +487,22 @@ def generate_mappings_only():
                 failed_mappings += 1
                 print(f"✗ No mapping found for template column: {template_col}")
 
-            # Save mapping to database (excluding *Buisness Unit Name)
-            mapping = ColumnMapping(
+            # Queue mapping for the bulk insert (excluding *Buisness Unit Name)
+            mapping_rows.append(dict(
                 fbdi_module="AR",
                 fbdi_subset="RA_INTERFACE_LINES_ALL",
                 template_column=str(template_col),
                 raw_column=str(raw_col_name) if raw_col_name else "",
-                status=status
-            )
-            db.session.add(mapping)
+                status=status,
+                mapping_set_id=mapping_set.id
+            ))
             mappings_inserted += 1
 
-        # Commit all mappings to database
+        # Insert all mappings in one executemany and commit them as the active set,
+        # bumping the version readers cache against
+        db.session.bulk_insert_mappings(ColumnMapping, mapping_rows)
+        mapping_set.activate()
+        MappingVersion.bump()
         db.session.commit()
         print(f"✓ Inserted {mappings_inserted} column mappings into database")
         
@@ -509,6 +528,9 @@ def clear_mappings():
     try:
         deleted_count = ColumnMapping.query.count()
         ColumnMapping.query.delete()
+        ActiveMappingSet.query.delete()
+        MappingSet.query.delete()
+        MappingVersion.bump()
         db.session.commit()
         return jsonify({"status": "success", "message": f"Deleted {deleted_count} mappings"})
     except Exception as e:
@@ -516,7 +538,7 @@ def clear_mappings():
 
 if __name__ == '__main__':
     print("Starting Flask application...")
-    print(f"Database URI: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"Database URI: {describe_database(app.config['SQLALCHEMY_DATABASE_URI'])}")
     
     create_tables()  # Create tables before running the app
     
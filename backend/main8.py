@@ -7,6 +7,8 @@ import zipfile
 import io
 import os
 from datetime import datetime
+# One copy shared with backend2, which owns it
+from backend2.db_setup import engine_options, install_sqlite_pragmas, describe_database
 
 app = Flask(__name__)
 CORS(app)
@@ -14,12 +16,15 @@ CORS(app)
 # === CONFIG ===
 instance_path = os.path.join(os.path.dirname(__file__), 'instance')
 os.makedirs(instance_path, exist_ok=True)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}'
+# DATABASE_URL switches to a server database; the SQLite default runs in WAL mode
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-print(f"Database path: {app.config['SQLALCHEMY_DATABASE_URI']}")
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+print(f"Database path: {describe_database(app.config['SQLALCHEMY_DATABASE_URI'])}")
 
 # === DB SETUP ===
-from backend.models1 import db, ColumnMapping
+from backend.models1 import db, ColumnMapping, upgrade_mapping_schema
+install_sqlite_pragmas()
 db.init_app(app)
 
 def format_date_for_column(data_series, column_name):
@@ -72,8 +77,9 @@ def get_latest_mappings():
         mapping_dict = {m.template_column: m.raw_column for m in mappings}
         return mapping_dict
     except Exception as e:
+        # An empty dict would silently generate unmapped FBDI files
         print(f"Error getting mappings: {e}")
-        return {}
+        raise
 
 @app.route('/preview-mappings', methods=['POST'])
 def preview_mappings():
@@ -228,6 +234,8 @@ def test_db():
 def create_tables():
     with app.app_context():
         db.create_all()
+        # create_all() never adds mapping_set_id to an existing column_mapping table
+        upgrade_mapping_schema()
         print("✓ Tables ensured")
 
 if __name__ == '__main__':
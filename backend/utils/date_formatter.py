@@ -17,50 +17,120 @@ class DateFormatter:
     
     DATE_KEYWORDS = ['date', 'Date', 'DATE', 'time', 'Time', 'TIME']
     
+    OUTPUT_FORMAT = '%Y/%m/%d'
+    SAMPLE_SIZE = 200
+    
     @staticmethod
-    def format_date_for_column(data_series, column_name):
-        """Format a pandas series containing dates to YYYY/MM/DD format"""
-        def format_single_date(date_value):
-            if pd.isna(date_value) or date_value == "" or date_value is None:
-                return date_value
+    def format_single_date(date_value):
+        """Format one value to YYYY/MM/DD, returning it unchanged if it cannot be parsed"""
+        if pd.isna(date_value) or date_value == "" or date_value is None:
+            return date_value
+        
+        try:
+            parsed_date = None
             
-            try:
-                parsed_date = None
+            # Handle different input types
+            if isinstance(date_value, str):
+                # Try different string formats
+                for fmt in DateFormatter.DATE_FORMATS:
+                    try:
+                        parsed_date = datetime.strptime(date_value, fmt)
+                        break
+                    except ValueError:
+                        continue
                 
-                # Handle different input types
-                if isinstance(date_value, str):
-                    # Try different string formats
-                    for fmt in DateFormatter.DATE_FORMATS:
-                        try:
-                            parsed_date = datetime.strptime(date_value, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    # If no format matches, try pandas to_datetime
-                    if parsed_date is None:
-                        try:
-                            parsed_date = pd.to_datetime(date_value)
-                        except:
-                            return date_value
-                            
-                elif isinstance(date_value, (datetime, pd.Timestamp)):
-                    parsed_date = date_value
-                else:
-                    # Try to convert using pandas
+                # If no format matches, try pandas to_datetime
+                if parsed_date is None:
                     try:
                         parsed_date = pd.to_datetime(date_value)
                     except:
                         return date_value
-                
-                # Always format as YYYY/MM/DD (date only, no time)
-                return parsed_date.strftime('%Y/%m/%d')
-                
-            except Exception as e:
-                print(f"Error formatting date {date_value}: {e}")
-                return date_value
+                        
+            elif isinstance(date_value, (datetime, pd.Timestamp)):
+                parsed_date = date_value
+            else:
+                # Try to convert using pandas
+                try:
+                    parsed_date = pd.to_datetime(date_value)
+                except:
+                    return date_value
+            
+            # Always format as YYYY/MM/DD (date only, no time)
+            return parsed_date.strftime(DateFormatter.OUTPUT_FORMAT)
+            
+        except Exception as e:
+            print(f"Error formatting date {date_value}: {e}")
+            return date_value
+    
+    @staticmethod
+    def detect_format(strings):
+        """Return the DATE_FORMATS entry that parses most of the sample, or None"""
+        best_fmt, best_hits = None, 0
+        for fmt in DateFormatter.DATE_FORMATS:
+            hits = pd.to_datetime(strings, format=fmt, errors='coerce').notna().sum()
+            if hits > best_hits:
+                best_fmt, best_hits = fmt, hits
+        return best_fmt
+    
+    @staticmethod
+    def parse_date_strings(strings):
+        """Parse a Series of strings with the same per-value format priority as format_single_date"""
+        formats = DateFormatter.DATE_FORMATS
+        dominant = DateFormatter.detect_format(strings.iloc[:DateFormatter.SAMPLE_SIZE])
+        if dominant is None:
+            return pd.Series(pd.NaT, index=strings.index, dtype='datetime64[ns]')
+        
+        parsed = pd.to_datetime(strings, format=dominant, errors='coerce')
+        
+        # Formats ranked above the dominant one still win where they also match
+        for fmt in reversed(formats[:formats.index(dominant)]):
+            hits = parsed.notna()
+            earlier = pd.to_datetime(strings[hits], format=fmt, errors='coerce').dropna()
+            parsed[earlier.index] = earlier
+        
+        # Leftovers walk the remaining formats in priority order
+        for fmt in formats:
+            missing = parsed.isna()
+            if not missing.any():
+                break
+            if fmt == dominant:
+                continue
+            attempt = pd.to_datetime(strings[missing], format=fmt, errors='coerce').dropna()
+            parsed[attempt.index] = attempt
+        
+        return parsed
+    
+    @staticmethod
+    def format_date_for_column(data_series, column_name):
+        """Format a pandas series containing dates to YYYY/MM/DD format (vectorized)"""
+        if pd.api.types.is_datetime64_any_dtype(data_series):
+            return data_series.dt.strftime(DateFormatter.OUTPUT_FORMAT)
+        
+        result = data_series.astype(object)
+        pending = data_series.notna() & (data_series != "")
+        if not pending.any():
+            return result
+        
+        kinds = data_series.map(type)
+        parsed = pd.Series(pd.NaT, index=data_series.index, dtype='datetime64[ns]')
+        
+        datetime_mask = pending & kinds.isin([datetime, pd.Timestamp])
+        if datetime_mask.any():
+            parsed[datetime_mask] = pd.to_datetime(data_series[datetime_mask], errors='coerce')
+        
+        string_mask = pending & (kinds == str)
+        if string_mask.any():
+            parsed[string_mask] = DateFormatter.parse_date_strings(data_series[string_mask])
+        
+        done = parsed.notna()
+        result[done] = parsed[done].dt.strftime(DateFormatter.OUTPUT_FORMAT)
+        
+        # Only values no format matched fall back to per-cell parsing
+        leftover = pending & ~done
+        if leftover.any():
+            result[leftover] = data_series[leftover].map(DateFormatter.format_single_date)
         
-        return data_series.apply(format_single_date)
+        return result
     
     @staticmethod
     def is_date_column(column_name):
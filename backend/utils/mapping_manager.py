@@ -12,8 +12,9 @@ class MappingManager:
                 .order_by(ColumnMapping.created_at.desc()).all()
             return {m.template_column: m.raw_column for m in mappings}
         except Exception as e:
+            # An empty dict would silently generate unmapped FBDI files
             print(f"Error getting mappings: {e}")
-            return {}
+            raise
     
     @staticmethod
     def create_mapping_preview(template_columns, raw_columns, stored_mappings):
@@ -2,13 +2,17 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 import os
 from config import Config
-from models import db
+from db_setup import install_sqlite_pragmas
+from models import db, upgrade_mapping_schema, upgrade_lease_columns
+from maintenance import start_maintenance
+from fbdi_jobs import renew_job_leases, fail_orphaned_jobs, cleanup_artifacts
 from routes import main_bp
-from fbdi_operations import fbdi_bp  # Make sure this import is correct
+from fbdi_operations import fbdi_bp, maintain_fbdi_pipelines  # Make sure this import is correct
+from fbdi_pipeline import cleanup_staged_uploads
 from report_generator import get_execution_report_and_generate_pdf
 
 
-def create_app():
+def create_app(start_background=True):
     app = Flask(__name__)
     
     # Configure CORS properly for all routes
@@ -24,6 +28,7 @@ def create_app():
     app.config.from_object(Config)
     
     # Initialize database
+    install_sqlite_pragmas(app.config['SQLITE_BUSY_TIMEOUT_MS'])
     db.init_app(app)
     
     # Register blueprints
@@ -39,19 +44,30 @@ def create_app():
     def internal_error(error):
         return jsonify({"error": "Internal server error"}), 500
     
+    # Every serving process heartbeats its jobs and picks up after processes that died
+    if start_background:
+        create_tables(app)
+        start_maintenance(app, [
+            renew_job_leases, fail_orphaned_jobs, cleanup_artifacts,
+            maintain_fbdi_pipelines, cleanup_staged_uploads
+        ])
+    
     return app
 
 def create_tables(app):
     with app.app_context():
         try:
             db.create_all()
+            upgrade_mapping_schema()
+            upgrade_lease_columns()
             print("✓ Tables ensured")
         except Exception as e:
             print(f"Error creating tables: {e}")
 
 if __name__ == '__main__':
     print("🚀 Starting Flask server...")
-    app = create_app()
+    # The debug reloader runs this block in two processes; only the serving child starts background work
+    app = create_app(start_background=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     create_tables(app)
     
     # Print all registered routes for debugging
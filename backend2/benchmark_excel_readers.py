@@ -0,0 +1,74 @@
+"""Compare Excel reader engines on real raw layouts.
+
+Usage: python benchmark_excel_readers.py [workbook ...] [--repeat N]
+
+With no paths it runs on the sample files in this directory: RAW.xlsx (raw upload
+layout) and the AutoInvoice .xls BI outputs. For every installed engine it times a
+full read_excel as reconciliation does it (title row skipped) and a RawFileStream
+pass as generation does it, and checks each engine's DataFrame against the first.
+"""
+import argparse
+import glob
+import os
+import time
+from excel_reader import (
+    XLSX_ENGINES, XLS_ENGINES, engine_available, is_legacy_xls, read_excel, select_engine
+)
+from raw_reader import RawFileStream
+
+
+def _time(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _stream_rows(path, engine):
+    with RawFileStream(path, engine=engine) as raw_stream:
+        return sum(batch.shape[0] for batch in raw_stream.batches())
+
+
+def benchmark(path, repeat):
+    engines = XLS_ENGINES if is_legacy_xls(path) else XLSX_ENGINES
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"\n{os.path.basename(path)} ({size_mb:.1f} MB), auto -> {select_engine(path)}")
+    print(f"  {'engine':<10} {'read_excel':>12} {'stream':>12}  rows  matches")
+
+    baseline = None
+    for engine in engines:
+        if not engine_available(engine):
+            print(f"  {engine:<10} not installed")
+            continue
+
+        read_seconds, frame = _time(lambda: read_excel(path, engine=engine, skiprows=1), repeat)
+        if is_legacy_xls(path):
+            stream_text = "-"
+        else:
+            stream_seconds, _ = _time(lambda: _stream_rows(path, engine), repeat)
+            stream_text = f"{stream_seconds:.3f}s"
+
+        if baseline is None:
+            baseline = frame
+        matches = "yes" if frame.equals(baseline) else "NO"
+        print(f"  {engine:<10} {read_seconds:>11.3f}s {stream_text:>12}  {len(frame):>4}  {matches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = args.paths or [os.path.join(here, "RAW.xlsx")] + sorted(glob.glob(os.path.join(here, "*.xls")))
+    for path in paths:
+        benchmark(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
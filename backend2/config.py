@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from db_setup import engine_options, describe_database
 
 load_dotenv()
 
@@ -8,15 +9,64 @@ class Config:
     instance_path = os.path.join(os.path.dirname(__file__), 'instance')
     os.makedirs(instance_path, exist_ok=True)
     
-    SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}'
+    # DATABASE_URL switches to a server database; the SQLite default runs in WAL mode
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(instance_path, "db.sqlite3")}')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, SQLITE_BUSY_TIMEOUT_MS)
+    
+    # FBDI generation: worker processes per conversion (1 = serial)
+    FBDI_WORKERS = int(os.getenv('FBDI_WORKERS', '1'))
+    # Batch generation: raw files converted concurrently
+    FBDI_BATCH_WORKERS = int(os.getenv('FBDI_BATCH_WORKERS', str(os.cpu_count() or 1)))
+    
+    # Async FBDI jobs: background threads, and where and for how long finished ZIPs are kept
+    FBDI_JOB_THREADS = int(os.getenv('FBDI_JOB_THREADS', '2'))
+    FBDI_ARTIFACT_DIR = os.getenv('FBDI_ARTIFACT_DIR', os.path.join(instance_path, 'artifacts'))
+    FBDI_ARTIFACT_TTL_SECONDS = int(os.getenv('FBDI_ARTIFACT_TTL_SECONDS', str(24 * 60 * 60)))
+    
+    # Background work is leased to a process, which renews it every heartbeat; leases not
+    # renewed within the TTL belong to a dead process and are taken over or failed
+    LEASE_HEARTBEAT_SECONDS = int(os.getenv('LEASE_HEARTBEAT_SECONDS', '30'))
+    LEASE_TTL_SECONDS = int(os.getenv('LEASE_TTL_SECONDS', '120'))
+    
+    # Oracle import pipelines: uploads are kept here until UCM accepts them; runs whose process died
+    # are resumed by another process once their lease expires
+    FBDI_PIPELINE_DIR = os.getenv('FBDI_PIPELINE_DIR', os.path.join(instance_path, 'pipelines'))
+    FBDI_PIPELINE_RESUME = os.getenv('FBDI_PIPELINE_RESUME', 'true').lower() == 'true'
+    # A failed run's upload is kept this long so the run can be resumed, then deleted
+    FBDI_PIPELINE_FILE_TTL_SECONDS = int(os.getenv('FBDI_PIPELINE_FILE_TTL_SECONDS', str(24 * 60 * 60)))
+    
+    # Content-addressed cache of generated FBDI ZIPs (LRU-evicted above the size cap)
+    FBDI_CACHE_DIR = os.getenv('FBDI_CACHE_DIR', os.path.join(instance_path, 'fbdi_cache'))
+    FBDI_CACHE_MAX_BYTES = int(os.getenv('FBDI_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    
+    # Upload sessions: raw files parsed once into Parquet, expired after TTL or over quota
+    UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(instance_path, 'upload_sessions'))
+    UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', str(4 * 60 * 60)))
+    UPLOAD_SESSION_MAX_BYTES = int(os.getenv('UPLOAD_SESSION_MAX_BYTES', str(5 * 1024 ** 3)))
+    
+    # Whole-sheet Excel reads (templates, previews): auto (fastest installed), calamine, openpyxl or xlrd.
+    # Streamed raw uploads always use openpyxl read-only to keep memory flat.
+    EXCEL_READER_ENGINE = os.getenv('EXCEL_READER_ENGINE', 'auto')
     
     # Oracle Cloud Configuration
     ORACLE_BASE_URL = os.getenv('ORACLE_BASE_URL', 'https://miterbrands-ibayqy-test.fa.ocs.oraclecloud.com')
     ORACLE_USERNAME = os.getenv('ORACLE_USERNAME')
     ORACLE_PASSWORD = os.getenv('ORACLE_PASSWORD')
     ORACLE_UCM_ACCOUNT = os.getenv('ORACLE_UCM_ACCOUNT', 'fin$/recievables$/import$')
+    # Oracle REST client: keep-alive connection pool size and retries for failed connects/GETs
+    ORACLE_HTTP_POOL_SIZE = int(os.getenv('ORACLE_HTTP_POOL_SIZE', '10'))
+    ORACLE_HTTP_RETRIES = int(os.getenv('ORACLE_HTTP_RETRIES', '3'))
+    # ESS status checks run on this many threads behind the single poller scheduler
+    ESS_POLLER_FETCH_THREADS = int(os.getenv('ESS_POLLER_FETCH_THREADS', '4'))
+    # ESS status polling: fixed, backoff, or adaptive (learns runtimes per JobDefName from ess_job_run)
+    ESS_POLL_STRATEGY = os.getenv('ESS_POLL_STRATEGY', 'adaptive')
+    ESS_POLL_INTERVAL = int(os.getenv('ESS_POLL_INTERVAL', '10'))
+    ESS_POLL_MAX_INTERVAL = int(os.getenv('ESS_POLL_MAX_INTERVAL', '60'))
     
     def __init__(self):
-        print(f"Database path: {self.SQLALCHEMY_DATABASE_URI}")
+        print(f"Database path: {describe_database(self.SQLALCHEMY_DATABASE_URI)}")
         print(f"Oracle Base URL: {self.ORACLE_BASE_URL}")
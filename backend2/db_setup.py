@@ -0,0 +1,60 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+_pragmas_installed = False
+
+
+def is_sqlite(database_uri):
+    return make_url(database_uri).get_backend_name() == 'sqlite'
+
+
+def engine_options(database_uri, pool_size=10, max_overflow=20, busy_timeout_ms=30000):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    File-backed SQLite gets a thread-shareable connection pool sized for concurrent
+    request threads and job workers, with the driver waiting on locks instead of
+    failing with "database is locked". Server databases get the same pool sizing
+    plus pre-ping and recycling for connections dropped by the server.
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        options = {'connect_args': {'timeout': busy_timeout_ms / 1000, 'check_same_thread': False}}
+        if url.database and url.database != ':memory:':
+            options.update(poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow)
+        return options
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800
+    }
+
+
+def install_sqlite_pragmas(busy_timeout_ms=30000):
+    """Put every new SQLite connection in WAL mode with synchronous=NORMAL and a busy timeout.
+
+    WAL lets readers proceed while a writer commits, and NORMAL skips the fsync per
+    commit that WAL makes unnecessary for durability against application crashes.
+    """
+    global _pragmas_installed
+    if _pragmas_installed:
+        return
+
+    @event.listens_for(Engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+
+    _pragmas_installed = True
+
+
+def describe_database(database_uri):
+    """Database URI with any password masked, for logging"""
+    return make_url(database_uri).render_as_string(hide_password=True)
@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from poll_strategies import FixedInterval, strategy_for, record_job_run
+
+TERMINAL_STATUSES = ('SUCCEEDED', 'WARNING', 'ERROR', 'FAILED')
+SUCCESS_STATUSES = ('SUCCEEDED', 'WARNING')
+
+
+class _TrackedJob:
+    def __init__(self, request_id, job_name, timeout, strategy, job_def_name=None):
+        self.request_id = request_id
+        self.job_name = job_name
+        self.job_def_name = job_def_name
+        self.strategy = strategy
+        self.attempt = 0
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.future = Future()
+
+    @property
+    def elapsed(self):
+        return int(time.monotonic() - self.started)
+
+    def next_delay(self):
+        delay = self.strategy.next_delay(self.attempt, time.monotonic() - self.started)
+        self.attempt += 1
+        return delay
+
+
+class EssJobPoller:
+    """Tracks any number of ESS requests from one scheduler thread.
+
+    Each tracked request is a Future that resolves to its final ESSJobStatusRF row,
+    or None on timeout, like poll_job_status. The scheduler keeps a heap of
+    next-check times and hands due checks to a small fetch pool, so hundreds of
+    running jobs cost fetch_threads + 1 threads rather than a sleeping worker each.
+    Tracking a request that is already tracked returns the existing Future.
+
+    Check times come from a PollStrategy per job. Finished jobs with a JobDefName are
+    recorded in ess_job_run, which the adaptive strategy learns expected runtimes from.
+    """
+
+    def __init__(self, app, client, fetch_threads=4):
+        self.app = app
+        self.client = client
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._fetch_pool = ThreadPoolExecutor(max_workers=fetch_threads, thread_name_prefix='ess-fetch')
+        self._thread = None
+
+    def track(self, request_id, job_name, timeout=600, interval=None, callback=None, job_def_name=None):
+        """Start polling an ESS request; callback(status_info or None) runs when it settles.
+
+        A fixed interval overrides the configured ESS_POLL_STRATEGY.
+        """
+        if interval:
+            strategy = FixedInterval(interval)
+        else:
+            with self.app.app_context():
+                strategy = strategy_for(self.app.config, job_def_name)
+
+        with self._cond:
+            job = self._jobs.get(request_id)
+            if job is None:
+                job = _TrackedJob(request_id, job_name, timeout, strategy, job_def_name)
+                self._jobs[request_id] = job
+                job.future.add_done_callback(lambda _: self._forget(request_id))
+                print(f"\n{'='*60}")
+                print(f"Starting to monitor {job_name} (Job ID: {request_id}, polling: {strategy.describe()})")
+                print(f"{'='*60}")
+                self._push(job, 0)
+            self._ensure_running()
+
+        if callback:
+            # A job that failed to be monitored settles its callback like a timeout
+            job.future.add_done_callback(lambda future: callback(None if future.exception() else future.result()))
+        return job.future
+
+    def tracked(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def _forget(self, request_id):
+        with self._cond:
+            self._jobs.pop(request_id, None)
+
+    def _push(self, job, delay):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+        self._cond.notify()
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ess-poller', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, job = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            self._fetch_pool.submit(self._check, job)
+
+    def _check(self, job):
+        """Runs on the fetch pool, where an escaping exception would be lost with the job.
+
+        Status errors are retried on the next check; anything else (e.g. a failing
+        poll strategy) fails the job's Future so its waiters are released.
+        """
+        try:
+            remaining = job.deadline - time.monotonic()
+            delay = min(job.next_delay(), max(remaining, 0))
+            try:
+                resp = self.client.get_job_status(job.request_id, timeout=30)
+                if resp.ok:
+                    items = resp.json().get('items', [])
+                    if items and self._report(job, items[0], delay):
+                        return
+                else:
+                    print(f"[ERROR] Failed to get status for {job.job_name}: {resp.text}")
+            except Exception as e:
+                print(f"[ERROR] Failed to get status for {job.job_name}: {e}")
+
+            if remaining <= 0:
+                print(f"\n⏰ TIMEOUT: {job.job_name} did not complete within {int(job.deadline - job.started)} seconds")
+                print(f"{'='*60}\n")
+                job.future.set_result(None)
+                return
+            with self._cond:
+                self._push(job, delay)
+        except Exception as e:
+            print(f"❌ Stopped monitoring {job.job_name} (Job ID: {job.request_id}): {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+
+    def _record(self, job, status):
+        try:
+            with self.app.app_context():
+                record_job_run(job.job_def_name, job.request_id, status, time.monotonic() - job.started)
+        except Exception as e:
+            print(f"⚠️ Could not record {job.job_name} runtime: {e}")
+
+    def _report(self, job, status_info, delay):
+        """Log one status row; settle the job and return True if it is terminal"""
+        status = status_info.get('RequestStatus')
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[{current_time}] {job.job_name} Status:")
+        print(f"  └─ Status: {status}")
+        print(f"  └─ Phase: {status_info.get('RequestPhase', 'N/A')}")
+        print(f"  └─ State: {status_info.get('RequestState', 'N/A')}")
+        print(f"  └─ Elapsed Time: {job.elapsed} seconds")
+
+        if status in TERMINAL_STATUSES:
+            print(f"\n🎯 {job.job_name} completed with status: {status}")
+            print("✅ Job completed successfully!" if status in SUCCESS_STATUSES else "❌ Job failed!")
+            print(f"{'='*60}\n")
+            self._record(job, status)
+            job.future.set_result(status_info)
+            return True
+
+        print(f"  └─ Still running... (will check again in {delay:.0f} seconds)")
+        print("-" * 40)
+        return False
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_ess_poller(app, client):
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = EssJobPoller(app, client, fetch_threads=app.config.get('ESS_POLLER_FETCH_THREADS', 4))
+    return _poller
@@ -0,0 +1,113 @@
+import importlib.util
+import zipfile
+from datetime import date, datetime, time
+import pandas as pd
+from config import Config
+
+ENGINE_AUTO = "auto"
+ENGINE_CALAMINE = "calamine"
+ENGINE_OPENPYXL = "openpyxl"
+ENGINE_XLRD = "xlrd"
+
+# Module each engine needs, and the engines able to read each container, fastest first
+ENGINE_MODULES = {
+    ENGINE_CALAMINE: "python_calamine",
+    ENGINE_OPENPYXL: "openpyxl",
+    ENGINE_XLRD: "xlrd",
+}
+XLSX_ENGINES = (ENGINE_CALAMINE, ENGINE_OPENPYXL)
+XLS_ENGINES = (ENGINE_CALAMINE, ENGINE_XLRD)
+# Row streaming defaults to openpyxl read-only: calamine decodes the whole sheet up front
+STREAMING_ENGINE = ENGINE_OPENPYXL
+
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+_available = {}
+
+
+def engine_available(engine):
+    if engine not in _available:
+        _available[engine] = importlib.util.find_spec(ENGINE_MODULES[engine]) is not None
+    return _available[engine]
+
+
+def is_legacy_xls(path):
+    """True for BIFF .xls workbooks (OLE2 container), as BI Publisher exports them"""
+    with open(path, "rb") as f:
+        return f.read(len(OLE2_MAGIC)) == OLE2_MAGIC
+
+
+def select_engine(path, engine=None):
+    """Pick the reader engine for a workbook.
+
+    engine (or EXCEL_READER_ENGINE) is honoured when it is installed and can read the
+    file's container; otherwise the fastest installed engine that can is used.
+    """
+    engine = engine or Config.EXCEL_READER_ENGINE
+    if zipfile.is_zipfile(path):
+        candidates = XLSX_ENGINES
+    elif is_legacy_xls(path):
+        candidates = XLS_ENGINES
+    else:
+        # Not a workbook container pandas can sniff; keep the historical xlrd choice
+        return ENGINE_XLRD
+
+    if engine in candidates and engine_available(engine):
+        return engine
+    for candidate in candidates:
+        if engine_available(candidate):
+            return candidate
+    raise ImportError(f"No Excel reader installed for {path}; install one of {', '.join(candidates)}")
+
+
+def read_excel(path, engine=None, **kwargs):
+    """pd.read_excel on the selected engine; every engine yields the same DataFrame contract"""
+    return pd.read_excel(path, engine=select_engine(path, engine), **kwargs)
+
+
+class SheetRows:
+    """Row-by-row access to the first sheet of a workbook as tuples of cell values.
+
+    openpyxl streams the sheet XML in read-only mode, keeping memory flat, and is used
+    unless calamine is passed explicitly: calamine decodes the whole sheet natively,
+    several times faster but holding every cell in memory at once, so
+    EXCEL_READER_ENGINE=auto does not apply here. Empty cells are None or "".
+    """
+
+    def __init__(self, path, engine=None):
+        if engine in (None, ENGINE_AUTO):
+            engine = STREAMING_ENGINE
+        self.engine = select_engine(path, engine)
+        self._workbook = None
+
+        if self.engine == ENGINE_CALAMINE:
+            from python_calamine import CalamineWorkbook
+
+            self._workbook = CalamineWorkbook.from_path(path)
+            self.rows = self._calamine_rows(self._workbook.get_sheet_by_index(0))
+        elif self.engine == ENGINE_OPENPYXL:
+            from openpyxl import load_workbook
+
+            self._workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+            self.rows = self._workbook.worksheets[0].iter_rows(values_only=True)
+        else:
+            raise ValueError(f"Engine {self.engine} cannot stream rows")
+
+    @staticmethod
+    def _calamine_rows(sheet):
+        # calamine ranges start at the first used cell; pad back to A1 like openpyxl
+        start_row, start_col = sheet.start or (0, 0)
+        for _ in range(start_row):
+            yield ()
+        lead = (None,) * start_col
+        for row in sheet.iter_rows():
+            # Date-only cells come back as date; openpyxl reports datetime
+            yield lead + tuple(
+                datetime.combine(v, time()) if type(v) is date else v
+                for v in row
+            )
+
+    def close(self):
+        if self._workbook is not None and hasattr(self._workbook, "close"):
+            self._workbook.close()
+        self._workbook = None
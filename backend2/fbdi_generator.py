@@ -0,0 +1,204 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from raw_reader import RawFileStream, RAW_BATCH_SIZE
+from mapping_plan import get_mapping_plans, needed_raw_columns
+
+# Secondary sheet CSVs are held in memory up to this size before spilling to disk
+SHEET_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that hands out whatever has been written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _render_batch(plans, raw_data):
+    """Render one raw batch as CSV text for every sheet plan"""
+    fragments = []
+    for plan in plans:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator=os.linesep)
+        writer.writerows(zip(*plan.build_columns(raw_data)))
+        fragments.append(buffer.getvalue())
+    return fragments
+
+
+_worker_plans = None
+
+
+def _init_worker(plans):
+    global _worker_plans
+    _worker_plans = plans
+
+
+def _render_batch_in_worker(raw_data):
+    return _render_batch(_worker_plans, raw_data), raw_data.shape[0]
+
+
+def _raw_batches(raw_stream, plans):
+    """Raw batches holding only the columns the plans map from.
+
+    With nothing mapped every column is kept, since the lines sheet still needs one
+    output row per raw row and a zero-column batch cannot carry a row count.
+    """
+    usecols = needed_raw_columns(plans)
+    if usecols:
+        print(f"✓ Reading {len(usecols)} of {raw_stream.width} raw columns")
+    return raw_stream.batches(usecols=usecols or None)
+
+
+def _iter_csv_fragments(raw_stream, plans, workers):
+    """Yield (csv_text per plan, row_count) per batch, in input order.
+
+    With more than one worker, batches are mapped and date-formatted in a process
+    pool that receives the plans once at start-up. At most two batches per worker are
+    in flight, and results are consumed in submission order, so the output is
+    byte-identical to serial mode.
+    """
+    if not workers or workers <= 1:
+        for raw_data in _raw_batches(raw_stream, plans):
+            yield _render_batch(plans, raw_data), raw_data.shape[0]
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(plans,)) as pool:
+        pending = deque()
+        for raw_data in _raw_batches(raw_stream, plans):
+            pending.append(pool.submit(_render_batch_in_worker, raw_data))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _write_fbdi_zip(raw_stream, plans, target, workers=1):
+    """Write every sheet's CSV into the ZIP from a single pass over the raw rows.
+
+    The lines CSV is encoded straight into its ZIP entry as batches are produced.
+    A ZIP can only have one entry open for writing, so the other sheets are spooled
+    during the pass and appended once it finishes. Yields the row count after each batch.
+    """
+    spools = [
+        tempfile.SpooledTemporaryFile(max_size=SHEET_SPOOL_MAX_BYTES, mode="w+", newline="", encoding="utf-8")
+        for _ in plans[1:]
+    ]
+    try:
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zipf:
+            entry = zipf.open(plans[0].sheet.csv_name, "w", force_zip64=True)
+            with io.TextIOWrapper(entry, encoding="utf-8", newline="") as csv_file:
+                for fragments, rows in _iter_csv_fragments(raw_stream, plans, workers):
+                    csv_file.write(fragments[0])
+                    csv_file.flush()
+                    for spool, fragment in zip(spools, fragments[1:]):
+                        spool.write(fragment)
+                    yield rows
+
+            for plan, spool in zip(plans[1:], spools):
+                spool.seek(0)
+                entry = zipf.open(plan.sheet.csv_name, "w", force_zip64=True)
+                with io.TextIOWrapper(entry, encoding="utf-8", newline="") as csv_file:
+                    shutil.copyfileobj(spool, csv_file)
+                yield 0
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def write_fbdi_zip(raw_path, template, target, sheet_mappings, batch_size=RAW_BATCH_SIZE, workers=1):
+    """Generate the FBDI ZIP for a raw file into a path or writable file object.
+
+    The raw file is read once and every template sheet with mapped columns gets its
+    CSV. Only one batch of raw rows and its mapped output are alive at a time, so
+    memory stays flat regardless of the number of raw lines. workers > 1 maps batches
+    in a process pool. Returns the number of raw rows processed.
+    """
+    with RawFileStream(raw_path, batch_size=batch_size) as raw_stream:
+        plans = get_mapping_plans(template, raw_stream.columns, sheet_mappings)
+        return sum(_write_fbdi_zip(raw_stream, plans, target, workers))
+
+
+def open_fbdi_zip_stream(raw_path, template, sheet_mappings, batch_size=RAW_BATCH_SIZE, workers=1, on_close=None):
+    """Prepare a streamed FBDI ZIP and return an iterator over its bytes.
+
+    The raw header is read and the mapping plans compiled up front so setup errors
+    surface before any bytes are sent. The iterator yields a piece of the archive
+    after every batch; on_close runs once it is exhausted or abandoned.
+    """
+    raw_stream = RawFileStream(raw_path, batch_size=batch_size)
+    try:
+        plans = get_mapping_plans(template, raw_stream.columns, sheet_mappings)
+    except Exception:
+        raw_stream.close()
+        raise
+
+    def chunks():
+        sink = _ChunkSink()
+        rows_written = 0
+        try:
+            for rows in _write_fbdi_zip(raw_stream, plans, sink, workers):
+                rows_written += rows
+                data = sink.drain()
+                if data:
+                    yield data
+            # Central directory written when the archive closes
+            yield sink.drain()
+            print(f"✓ Streamed {rows_written} FBDI rows ({', '.join(p.sheet.csv_name for p in plans)})")
+        finally:
+            raw_stream.close()
+            if on_close:
+                on_close()
+
+    return chunks()
+
+
+_batch_template = None
+_batch_sheet_mappings = None
+
+
+def _init_batch_worker(template, sheet_mappings):
+    global _batch_template, _batch_sheet_mappings
+    _batch_template = template
+    _batch_sheet_mappings = sheet_mappings
+
+
+def _generate_in_batch_worker(raw_path, zip_path):
+    return write_fbdi_zip(raw_path, _batch_template, zip_path, _batch_sheet_mappings)
+
+
+def generate_fbdi_batch(jobs, template, sheet_mappings, workers=1):
+    """Generate one FBDI ZIP per (raw_path, zip_path) pair on a process pool.
+
+    Every worker receives the parsed template and mapping set once at start-up, and
+    files sharing a raw header layout reuse that worker's compiled plans. Returns the
+    row count per pair, in input order.
+    """
+    if not workers or workers <= 1 or len(jobs) <= 1:
+        return [write_fbdi_zip(raw_path, template, zip_path, sheet_mappings) for raw_path, zip_path in jobs]
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)),
+        initializer=_init_batch_worker,
+        initargs=(template, sheet_mappings)
+    ) as pool:
+        futures = [pool.submit(_generate_in_batch_worker, raw_path, zip_path) for raw_path, zip_path in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,159 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from models import db, FbdiJob
+from leases import take_lease, renew_leases, lease_expired, utcnow
+from utils import get_sheet_mappings, file_sha256
+from template_registry import get_template, TEMPLATE_SHEET
+from fbdi_generator import write_fbdi_zip
+from output_cache import get_output_cache
+
+JOB_QUEUED = 'QUEUED'
+JOB_RUNNING = 'RUNNING'
+JOB_SUCCEEDED = 'SUCCEEDED'
+JOB_FAILED = 'FAILED'
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('FBDI_JOB_THREADS', 2),
+                thread_name_prefix='fbdi-job'
+            )
+    return _executor
+
+
+def artifact_dir(app):
+    path = app.config['FBDI_ARTIFACT_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _run_job(app, job_id, raw_path, raw_hash):
+    with app.app_context():
+        job = db.session.get(FbdiJob, job_id)
+        job.status = JOB_RUNNING
+        db.session.commit()
+
+        artifact_path = os.path.join(artifact_dir(app), f"{job_id}.zip")
+        partial_path = artifact_path + ".part"
+        try:
+            template = get_template(job.fbdi_type)
+            sheet_mappings = get_sheet_mappings(template.sheet_names, TEMPLATE_SHEET, job.fbdi_type)
+
+            output_cache = get_output_cache(app)
+            cache_key = output_cache.key_for(raw_hash or file_sha256(raw_path), template, sheet_mappings)
+            cached_zip = output_cache.get(cache_key)
+            if cached_zip:
+                shutil.copyfile(cached_zip, partial_path)
+                rows_written = None
+                print(f"✓ FBDI job {job_id} served from cache {cache_key[:12]}")
+            else:
+                rows_written = write_fbdi_zip(
+                    raw_path, template, partial_path, sheet_mappings,
+                    workers=app.config.get('FBDI_WORKERS', 1)
+                )
+                shutil.copyfile(partial_path, partial_path + ".cache")
+                output_cache.put(cache_key, partial_path + ".cache")
+            os.replace(partial_path, artifact_path)
+
+            job.status = JOB_SUCCEEDED
+            job.rows_written = rows_written
+            job.artifact_path = artifact_path
+            print(f"✓ FBDI job {job_id} finished")
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(FbdiJob, job_id)
+            job.status = JOB_FAILED
+            job.error = str(e)
+            print(f"❌ FBDI job {job_id} failed: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        finally:
+            db.session.commit()
+            db.session.remove()
+            os.remove(raw_path)
+
+
+def submit_fbdi_job(app, raw_path, fbdi_type, project_name=None, env_type=None, raw_hash=None):
+    """Record a queued job and run generation for raw_path on the background executor.
+
+    The job takes ownership of raw_path and deletes it when done. raw_hash is the
+    original upload's hash when raw_path is a copy of an upload session. Returns the job ID.
+    """
+    job_id = str(uuid.uuid4())
+    job = FbdiJob(
+        id=job_id,
+        fbdi_type=fbdi_type,
+        project_name=project_name,
+        env_type=env_type,
+        status=JOB_QUEUED
+    )
+    take_lease(job)
+    db.session.add(job)
+    db.session.commit()
+
+    _get_executor(app).submit(_run_job, app, job_id, raw_path, raw_hash)
+    return job_id
+
+
+def get_job(job_id):
+    return db.session.get(FbdiJob, job_id)
+
+
+def renew_job_leases(app):
+    renew_leases(FbdiJob, ACTIVE_STATUSES)
+
+
+def fail_orphaned_jobs(app):
+    """Fail queued/running jobs whose process died: their raw upload went with it, so they cannot be requeued"""
+    orphaned = FbdiJob.query.filter(
+        FbdiJob.status.in_(ACTIVE_STATUSES),
+        lease_expired(FbdiJob, app.config['LEASE_TTL_SECONDS'])
+    ).update({
+        FbdiJob.status: JOB_FAILED,
+        FbdiJob.error: "Interrupted by a server restart; submit the file again"
+    }, synchronize_session=False)
+    db.session.commit()
+    if orphaned:
+        print(f"⚠️ Marked {orphaned} orphaned FBDI job(s) as failed")
+
+
+def cleanup_artifacts(app):
+    """Delete job ZIPs older than FBDI_ARTIFACT_TTL_SECONDS, and stray files a crashed job left behind"""
+    ttl_seconds = app.config['FBDI_ARTIFACT_TTL_SECONDS']
+    expired = FbdiJob.query.filter(
+        FbdiJob.artifact_path.isnot(None),
+        FbdiJob.updated_at < utcnow() - timedelta(seconds=ttl_seconds)
+    ).all()
+    for job in expired:
+        try:
+            os.remove(job.artifact_path)
+        except FileNotFoundError:
+            pass
+        job.artifact_path = None
+    db.session.commit()
+
+    path = artifact_dir(app)
+    referenced = {p for (p,) in db.session.query(FbdiJob.artifact_path).filter(FbdiJob.artifact_path.isnot(None)).all()}
+    removed = len(expired)
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        try:
+            if file_path not in referenced and time.time() - os.path.getmtime(file_path) > ttl_seconds:
+                os.remove(file_path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        print(f"✓ Removed {removed} expired FBDI job artifact(s)")
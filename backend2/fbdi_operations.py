@@ -1,9 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_cors import cross_origin
-import base64
-import requests
-import time
 from datetime import datetime
+from models import db, FbdiPipelineRun
+from oracle_client import get_oracle_client
+from ess_poller import get_ess_poller
+from leases import renew_leases
+from fbdi_pipeline import get_fbdi_pipeline, RUN_RUNNING, RUN_SUCCEEDED, RUN_FAILED, POLL_STEPS, STEP_INTERFACE_POLL
  
  
 fbdi_bp = Blueprint('fbdi', __name__)
@@ -17,68 +19,52 @@ ORACLE_CLOUD_CONFIG = {
     'ess_service_url': '/fscmRestApi/resources/11.13.18.05/erpintegrations'
 }
  
+def oracle_client():
+    """Shared keep-alive ERP client; every call in a pipeline reuses its connections"""
+    return get_oracle_client(current_app, ORACLE_CLOUD_CONFIG)
  
-def get_oracle_headers():
-    creds = f"{ORACLE_CLOUD_CONFIG['username']}:{ORACLE_CLOUD_CONFIG['password']}"
-    token = base64.b64encode(creds.encode()).decode()
-    return {
-        'Authorization': f'Basic {token}',
-        'Content-Type': 'application/vnd.oracle.adf.resourceitem+json'
-    }
  
+def ess_poller():
+    """Shared ESS poller; every tracked job is checked from its one scheduler loop"""
+    return get_ess_poller(current_app._get_current_object(), oracle_client())
  
-def poll_job_status(request_id, job_name, timeout=600, interval=10):
-    """Poll an ESS job until it reaches a terminal status with status updates."""
-    url = ORACLE_CLOUD_CONFIG['base_url'] + ORACLE_CLOUD_CONFIG['ess_service_url']
-    headers = get_oracle_headers()
-    elapsed = 0
-   
-    print(f"\n{'='*60}")
-    print(f"Starting to monitor {job_name} (Job ID: {request_id})")
-    print(f"{'='*60}")
- 
-    while elapsed < timeout:
-        resp = requests.get(url,
-            headers=headers,
-            params={'finder': f"ESSJobStatusRF;requestId={request_id}"},
-            timeout=30)
-       
-        if resp.ok:
-            items = resp.json().get('items', [])
-            if items:
-                status_info = items[0]
-                status = status_info.get('RequestStatus')
-                phase = status_info.get('RequestPhase', 'N/A')
-                state = status_info.get('RequestState', 'N/A')
-               
-                # Print current status with timestamp
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                print(f"[{current_time}] {job_name} Status:")
-                print(f"  └─ Status: {status}")
-                print(f"  └─ Phase: {phase}")
-                print(f"  └─ State: {state}")
-                print(f"  └─ Elapsed Time: {elapsed} seconds")
-               
-                if status in ('SUCCEEDED','WARNING','ERROR','FAILED'):
-                    print(f"\n🎯 {job_name} completed with status: {status}")
-                    if status in ('SUCCEEDED','WARNING'):
-                        print("✅ Job completed successfully!")
-                    else:
-                        print("❌ Job failed!")
-                    print(f"{'='*60}\n")
-                    return status_info
-                   
-                print(f"  └─ Still running... (will check again in {interval} seconds)")
-                print("-" * 40)
-        else:
-            print(f"[ERROR] Failed to get status for {job_name}: {resp.text}")
-           
-        time.sleep(interval)
-        elapsed += interval
- 
-    print(f"\n⏰ TIMEOUT: {job_name} did not complete within {timeout} seconds")
-    print(f"{'='*60}\n")
-    return None
+ 
+def fbdi_pipeline():
+    """Shared pipeline executor; every run's progress is persisted in fbdi_pipeline_run"""
+    return get_fbdi_pipeline(current_app._get_current_object(), oracle_client(), ess_poller(),
+                             ORACLE_CLOUD_CONFIG['ucm_account'])
+ 
+ 
+def maintain_fbdi_pipelines(app):
+    """Maintenance task: heartbeat this process's runs and continue runs left by a process that died"""
+    if not app.config['FBDI_PIPELINE_RESUME']:
+        # Stalled runs are then only resumed through the resume endpoint
+        renew_leases(FbdiPipelineRun, (RUN_RUNNING,))
+        return
+    resumed = fbdi_pipeline().maintain()
+    if resumed:
+        print(f"✓ Resumed {resumed} unfinished FBDI pipeline(s)")
+ 
+ 
+def poll_job_status(request_id, job_name, timeout=600, interval=None, job_def_name=None):
+    """Wait for an ESS job to reach a terminal status; returns its status row, or None on timeout.
+    Polls on the configured ESS_POLL_STRATEGY unless a fixed interval is given."""
+    return ess_poller().track(request_id, job_name, timeout=timeout, interval=interval,
+                              job_def_name=job_def_name).result()
+ 
+ 
+def pipeline_error_response(result):
+    """Error body and status code of a failed run, as /process-fbdi has always returned them"""
+    step = result['step']
+    if step in POLL_STEPS:
+        job_id = result['interface_job_id'] if step == STEP_INTERFACE_POLL else result['autoinvoice_job_id']
+        return jsonify({
+            "step": step,
+            "job_id": job_id,
+            "status": result['error'],
+            "pipeline_id": result['pipeline_id']
+        }), 500
+    return jsonify({"step": step, "error": result['error'], "pipeline_id": result['pipeline_id']}), result['error_code'] or 500
  
  
 @fbdi_bp.route('/process-fbdi', methods=['POST','OPTIONS'])
@@ -120,112 +106,15 @@ def process_fbdi():
     print(f"  └─ Batch Source: {batch_source}")
     print(f"  └─ GL Date: {gl_date}")
  
-    # Read & base64‐encode FBDI
-    print("\n📁 Reading and encoding file...")
-    content = fbdi_file.read()
-    b64 = base64.b64encode(content).decode()
-    print(f"✅ File encoded successfully (Size: {len(content)} bytes)")
- 
-    # 2) Upload to UCM
-    print(f"\n📤 Step 2: Uploading to UCM...")
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    ucm_filename = f"RaInterfaceLinesAll{timestamp}.zip"
-    ucm_payload = {
-        "OperationName":   "uploadFileToUCM",
-        "DocumentContent": b64,
-        "DocumentAccount": ORACLE_CLOUD_CONFIG['ucm_account'],
-        "ContentType":     "zip",
-        "FileName":        ucm_filename,
-        "DocumentId":      None
-    }
- 
-    url = ORACLE_CLOUD_CONFIG['base_url'] + ORACLE_CLOUD_CONFIG['ess_service_url']
-    print(f"🔄 Uploading file: {ucm_filename}")
-    upload_resp = requests.post(url,
-        headers=get_oracle_headers(),
-        json=ucm_payload,
-        timeout=60)
-   
-    if not upload_resp.ok:
-        print(f"❌ Upload failed: {upload_resp.text}")
-        return jsonify({"step":"upload","error":upload_resp.text}), upload_resp.status_code
- 
-    document_id = upload_resp.json().get('DocumentId')
-    print(f"✅ File uploaded successfully!")
-    print(f"  └─ Document ID: {document_id}")
-    print(f"  └─ UCM Filename: {ucm_filename}")
- 
-    # 3) Submit Interface Loader
-    print(f"\n🔧 Step 3: Submitting Interface Loader...")
-    ess_if_payload = {
-        "OperationName": "submitESSJobRequest",
-        "JobPackageName": "oracle/apps/ess/financials/commonModules/shared/common/interfaceLoader",
-        "JobDefName": "InterfaceLoaderController",
-        "ESSParameters": f"2,{document_id},N,N,N"
-    }
-   
-    print("🔄 Submitting Interface Loader job...")
-    if_resp = requests.post(url,
-        headers=get_oracle_headers(),
-        json=ess_if_payload,
-        timeout=30)
-   
-    if not if_resp.ok:
-        print(f"❌ Interface Loader submission failed: {if_resp.text}")
-        return jsonify({"step":"interface_submit","error":if_resp.text}), if_resp.status_code
- 
-    interface_job_id = if_resp.json().get('ReqstId')
-    print(f"✅ Interface Loader submitted successfully!")
-    print(f"  └─ Job ID: {interface_job_id}")
-   
-    # Poll Interface Loader status
-    interface_status = poll_job_status(interface_job_id, "Interface Loader")
-    if not interface_status or interface_status['RequestStatus'] not in ('SUCCEEDED','WARNING'):
-        final_status = interface_status.get('RequestStatus') if interface_status else 'TIMEOUT'
-        print(f"❌ Interface Loader failed with status: {final_status}")
-        return jsonify({
-            "step":"interface_poll",
-            "job_id":interface_job_id,
-            "status": final_status
-        }), 500
- 
-    print(f"✅ Interface Loader completed successfully with status: {interface_status['RequestStatus']}")
+    # 2-4) Persist the run, then upload, submit and poll each step; progress survives a restart
+    fbdi_file.stream.seek(0)
+    run_id, future = fbdi_pipeline().start(fbdi_file.stream, business_unit, batch_source, gl_date)
+    print(f"🔄 Pipeline {run_id} started, waiting for Interface Loader and Auto Invoice Import...")
+    result = future.result()
  
-    # 4) Submit Auto Invoice Import
-    print(f"\n💰 Step 4: Submitting Auto Invoice Import...")
-    ess_ai_payload = {
-        "OperationName": "submitESSJobRequest",
-        "JobPackageName": "/oracle/apps/ess/financials/receivables/transactions/autoInvoices/",
-        "JobDefName": "AutoInvoiceImportEss",
-        "ESSParameters": f"{business_unit},{batch_source},{gl_date},,,,,,,,,,,,,,,,,,,,Y,N"
-    }
-   
-    print("🔄 Submitting Auto Invoice Import job...")
-    ai_resp = requests.post(url,
-        headers=get_oracle_headers(),
-        json=ess_ai_payload,
-        timeout=30)
-   
-    if not ai_resp.ok:
-        print(f"❌ Auto Invoice Import submission failed: {ai_resp.text}")
-        return jsonify({"step":"autoinvoice_submit","error":ai_resp.text}), ai_resp.status_code
- 
-    autoinvoice_job_id = ai_resp.json().get('ReqstId')
-    print(f"✅ Auto Invoice Import submitted successfully!")
-    print(f"  └─ Job ID: {autoinvoice_job_id}")
-   
-    # Poll Auto Invoice Import status
-    invoice_status = poll_job_status(autoinvoice_job_id, "Auto Invoice Import")
-    if not invoice_status or invoice_status['RequestStatus'] not in ('SUCCEEDED','WARNING'):
-        final_status = invoice_status.get('RequestStatus') if invoice_status else 'TIMEOUT'
-        print(f"❌ Auto Invoice Import failed with status: {final_status}")
-        return jsonify({
-            "step":"autoinvoice_poll",
-            "job_id":autoinvoice_job_id,
-            "status": final_status
-        }), 500
- 
-    print(f"✅ Auto Invoice Import completed successfully with status: {invoice_status['RequestStatus']}")
+    if result['status'] != RUN_SUCCEEDED:
+        print(f"❌ Pipeline {run_id} failed at {result['step']}: {result['error']}")
+        return pipeline_error_response(result)
  
     # 5) Success
     print(f"\n🎉 SUCCESS: All operations completed successfully!")
@@ -234,10 +123,77 @@ def process_fbdi():
    
     return jsonify({
         "status":"success",
-        "document_id": document_id,
-        "ucm_filename": ucm_filename,
-        "interface_job_id": interface_job_id,
-        "interface_status": interface_status['RequestStatus'],
-        "autoinvoice_job_id": autoinvoice_job_id,
-        "autoinvoice_status": invoice_status['RequestStatus']
-    }), 200
\ No newline at end of file
+        "pipeline_id": run_id,
+        "document_id": result['document_id'],
+        "ucm_filename": result['ucm_filename'],
+        "interface_job_id": result['interface_job_id'],
+        "interface_status": result['interface_status'],
+        "autoinvoice_job_id": result['autoinvoice_job_id'],
+        "autoinvoice_status": result['autoinvoice_status']
+    }), 200
+ 
+ 
+@fbdi_bp.route('/process-fbdi/async', methods=['POST'])
+@cross_origin()
+def process_fbdi_async():
+    """
+    Same pipeline as /process-fbdi, but returns 202 once the run is recorded and handed to Oracle.
+    Progress is at /process-fbdi/runs/<pipeline_id>.
+    """
+    fbdi_file = request.files.get('fbdi_file')
+    if not fbdi_file:
+        return jsonify({"error":"Missing field 'fbdi_file'"}), 400
+ 
+    try:
+        fbdi_file.stream.seek(0)
+        run_id, future = fbdi_pipeline().start(
+            fbdi_file.stream,
+            request.form.get('business_unit','300000003170678'),
+            request.form.get('batch_source','MILGARD EBS SPREADSHEET'),
+            request.form.get('gl_date', datetime.now().strftime('%Y-%m-%d'))
+        )
+        run = db.session.get(FbdiPipelineRun, run_id)
+        if run.status == RUN_FAILED:
+            return pipeline_error_response(run.to_dict())
+        return jsonify(run.to_dict()), 202
+    except Exception as e:
+        print(f"❌ Error starting FBDI pipeline: {e}")
+        return jsonify({"error": str(e)}), 500
+ 
+ 
+@fbdi_bp.route('/process-fbdi/runs/<pipeline_id>', methods=['GET'])
+@cross_origin()
+def get_pipeline(pipeline_id):
+    run = db.session.get(FbdiPipelineRun, pipeline_id)
+    if not run:
+        return jsonify({"error": "Pipeline not found"}), 404
+    return jsonify(run.to_dict())
+ 
+ 
+@fbdi_bp.route('/process-fbdi/runs/<pipeline_id>/resume', methods=['POST'])
+@cross_origin()
+def resume_pipeline(pipeline_id):
+    """Retry a failed run from its last completed step, e.g. after an upload error or poll timeout.
+    A running run can be resumed once its process has stopped renewing its lease."""
+    try:
+        run = db.session.get(FbdiPipelineRun, pipeline_id)
+        if not run:
+            return jsonify({"error": "Pipeline not found"}), 404
+        if run.status not in (RUN_FAILED, RUN_RUNNING):
+            return jsonify({"error": f"Pipeline is {run.status}, only failed or stalled runs can be resumed"}), 409
+        if not run.document_id and not run.file_path:
+            return jsonify({"error": "The staged upload has expired; submit the file again"}), 410
+        step = run.step
+        db.session.remove()
+        if fbdi_pipeline().resume(pipeline_id) is None:
+            return jsonify({"error": "Pipeline is still being run by a live server process"}), 409
+        return jsonify({"pipeline_id": pipeline_id, "status": RUN_RUNNING, "step": step}), 202
+    except Exception as e:
+        print(f"❌ Error resuming FBDI pipeline {pipeline_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+ 
+ 
+@fbdi_bp.route('/ess-poller', methods=['GET'])
+@cross_origin()
+def ess_poller_stats():
+    return jsonify({"tracked_jobs": ess_poller().tracked()})
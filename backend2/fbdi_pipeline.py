@@ -0,0 +1,321 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db, FbdiPipelineRun
+from ess_poller import SUCCESS_STATUSES
+from leases import PROCESS_ID, take_lease, claim, renew_leases, lease_expired, utcnow
+
+RUN_RUNNING = 'RUNNING'
+RUN_SUCCEEDED = 'SUCCEEDED'
+RUN_FAILED = 'FAILED'
+
+STEP_UPLOAD = 'upload'
+STEP_INTERFACE_SUBMIT = 'interface_submit'
+STEP_INTERFACE_POLL = 'interface_poll'
+STEP_AUTOINVOICE_SUBMIT = 'autoinvoice_submit'
+STEP_AUTOINVOICE_POLL = 'autoinvoice_poll'
+STEP_DONE = 'done'
+POLL_STEPS = (STEP_INTERFACE_POLL, STEP_AUTOINVOICE_POLL)
+
+INTERFACE_LOADER_PACKAGE = "oracle/apps/ess/financials/commonModules/shared/common/interfaceLoader"
+AUTOINVOICE_PACKAGE = "/oracle/apps/ess/financials/receivables/transactions/autoInvoices/"
+INTERFACE_LOADER_JOB = "InterfaceLoaderController"
+AUTOINVOICE_JOB = "AutoInvoiceImportEss"
+
+
+def submit_interface_loader(client, document_id):
+    return client.submit_ess_job(
+        INTERFACE_LOADER_PACKAGE,
+        INTERFACE_LOADER_JOB,
+        f"2,{document_id},N,N,N",
+        timeout=30)
+
+
+def submit_autoinvoice(client, business_unit, batch_source, gl_date):
+    return client.submit_ess_job(
+        AUTOINVOICE_PACKAGE,
+        AUTOINVOICE_JOB,
+        f"{business_unit},{batch_source},{gl_date},,,,,,,,,,,,,,,,,,,,Y,N",
+        timeout=30)
+
+
+def next_step(run):
+    """First step whose result is not yet recorded on the run"""
+    if not run.document_id:
+        return STEP_UPLOAD
+    if not run.interface_job_id:
+        return STEP_INTERFACE_SUBMIT
+    if not run.interface_status:
+        return STEP_INTERFACE_POLL
+    if not run.autoinvoice_job_id:
+        return STEP_AUTOINVOICE_SUBMIT
+    if not run.autoinvoice_status:
+        return STEP_AUTOINVOICE_POLL
+    return STEP_DONE
+
+
+class FbdiPipeline:
+    """Runs FBDI pipelines step by step, committing each step's Oracle IDs as soon as Oracle returns them.
+
+    A run's next step is derived from what it has recorded, so a run picked up again
+    after a restart continues where it stopped: a run with a DocumentId is not
+    uploaded again, and one with a job ID polls that job rather than resubmitting it.
+    The upload is kept under pipeline_dir until UCM accepts it. ESS jobs are followed
+    by the shared poller, so no thread is held while Oracle runs them.
+
+    A running run is leased to one process, which renews the lease from maintain().
+    Runs whose lease lapses (their process died) are claimed and continued by
+    whichever live process maintains next; a process that lost a run's lease stops
+    advancing it.
+    """
+
+    def __init__(self, app, client, poller, ucm_account, pipeline_dir, lease_ttl_seconds=120):
+        self.app = app
+        self.client = client
+        self.poller = poller
+        self.ucm_account = ucm_account
+        self.pipeline_dir = pipeline_dir
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._resume_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fbdi-pipeline')
+        os.makedirs(pipeline_dir, exist_ok=True)
+
+    def start(self, fbdi_stream, business_unit, batch_source, gl_date):
+        """Persist the upload and a new run, then advance it until it waits on Oracle.
+
+        Returns (run_id, future); the future resolves to the run's final to_dict().
+        """
+        run_id = str(uuid.uuid4())
+        file_path = os.path.join(self.pipeline_dir, f"{run_id}.zip")
+        with open(file_path, 'wb') as f:
+            shutil.copyfileobj(fbdi_stream, f)
+
+        run = FbdiPipelineRun(
+            id=run_id,
+            status=RUN_RUNNING,
+            step=STEP_UPLOAD,
+            file_path=file_path,
+            ucm_filename=f"RaInterfaceLinesAll{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            business_unit=business_unit,
+            batch_source=batch_source,
+            gl_date=gl_date
+        )
+        take_lease(run)
+        db.session.add(run)
+        db.session.commit()
+
+        future = self._waiter(run_id)
+        self.advance(run_id)
+        return run_id, future
+
+    def resume(self, run_id):
+        """Continue a failed run, or a running one whose process died, from its last completed step.
+
+        Returns the run's future, or None if the run is finished or a live process holds it.
+        """
+        with self.app.app_context():
+            try:
+                # Both updates are conditional, so concurrent resumes cannot both win
+                restarted = FbdiPipelineRun.query.filter(
+                    FbdiPipelineRun.id == run_id,
+                    FbdiPipelineRun.status == RUN_FAILED
+                ).update({
+                    FbdiPipelineRun.status: RUN_RUNNING,
+                    FbdiPipelineRun.error: None,
+                    FbdiPipelineRun.error_code: None,
+                    FbdiPipelineRun.owner: PROCESS_ID,
+                    FbdiPipelineRun.heartbeat_at: utcnow()
+                }, synchronize_session=False)
+                db.session.commit()
+                if not restarted:
+                    run = db.session.get(FbdiPipelineRun, run_id)
+                    if run is None or run.status != RUN_RUNNING or not claim(FbdiPipelineRun, run_id, self.lease_ttl_seconds):
+                        return None
+            finally:
+                db.session.remove()
+        future = self._waiter(run_id)
+        self._resume_executor.submit(self.advance, run_id)
+        return future
+
+    def maintain(self):
+        """Heartbeat this process's running runs and take over runs whose process died"""
+        renew_leases(FbdiPipelineRun, (RUN_RUNNING,))
+        stranded = [run_id for (run_id,) in db.session.query(FbdiPipelineRun.id).filter(
+            FbdiPipelineRun.status == RUN_RUNNING,
+            lease_expired(FbdiPipelineRun, self.lease_ttl_seconds)
+        ).all()]
+        resumed = 0
+        for run_id in stranded:
+            if claim(FbdiPipelineRun, run_id, self.lease_ttl_seconds):
+                print(f"🔁 Resuming FBDI pipeline {run_id}")
+                self._resume_executor.submit(self.advance, run_id)
+                resumed += 1
+        return resumed
+
+    def _waiter(self, run_id):
+        with self._lock:
+            future = self._waiters.get(run_id)
+            if future is None or future.done():
+                future = self._waiters[run_id] = Future()
+            return future
+
+    def advance(self, run_id):
+        """Run steps until the run finishes or hands an ESS job to the poller"""
+        with self.app.app_context():
+            run = db.session.get(FbdiPipelineRun, run_id)
+            try:
+                while run.status == RUN_RUNNING:
+                    # Another process claimed the run after this one's lease lapsed
+                    db.session.refresh(run)
+                    if run.owner != PROCESS_ID:
+                        print(f"⚠️ Pipeline {run_id} is now run by {run.owner}; stopping here")
+                        return
+                    step = next_step(run)
+                    run.step = step
+                    if step == STEP_DONE:
+                        run.status = RUN_SUCCEEDED
+                        print(f"🎉 FBDI pipeline {run_id} completed successfully")
+                    elif step in POLL_STEPS:
+                        db.session.commit()
+                        self._watch(run, step)
+                        return
+                    else:
+                        self._run_step(run, step)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                run = db.session.get(FbdiPipelineRun, run_id)
+                self._fail(run, run.step, str(e), 500)
+                db.session.commit()
+            finally:
+                result = run.to_dict()
+                db.session.remove()
+        self._settle(run_id, result)
+
+    def _run_step(self, run, step):
+        if step == STEP_UPLOAD:
+            if not run.file_path or not os.path.exists(run.file_path):
+                return self._fail(run, step, "The staged upload has expired; submit the file again", 410)
+            print(f"📤 Pipeline {run.id}: uploading {run.ucm_filename} to UCM...")
+            with open(run.file_path, 'rb') as f:
+                resp = self.client.upload_stream_to_ucm(f, run.ucm_filename, self.ucm_account, timeout=60)
+            if not resp.ok:
+                return self._fail(run, step, resp.text, resp.status_code)
+            run.document_id = resp.json().get('DocumentId')
+            # Persist the DocumentId before dropping the local copy: UCM now holds the file
+            db.session.commit()
+            os.remove(run.file_path)
+            run.file_path = None
+            print(f"✅ Pipeline {run.id}: uploaded, Document ID {run.document_id}")
+
+        elif step == STEP_INTERFACE_SUBMIT:
+            resp = submit_interface_loader(self.client, run.document_id)
+            if not resp.ok:
+                return self._fail(run, step, resp.text, resp.status_code)
+            run.interface_job_id = resp.json().get('ReqstId')
+            print(f"✅ Pipeline {run.id}: Interface Loader submitted, Job ID {run.interface_job_id}")
+
+        elif step == STEP_AUTOINVOICE_SUBMIT:
+            resp = submit_autoinvoice(self.client, run.business_unit, run.batch_source, run.gl_date)
+            if not resp.ok:
+                return self._fail(run, step, resp.text, resp.status_code)
+            run.autoinvoice_job_id = resp.json().get('ReqstId')
+            print(f"✅ Pipeline {run.id}: Auto Invoice Import submitted, Job ID {run.autoinvoice_job_id}")
+
+    def _watch(self, run, step):
+        if step == STEP_INTERFACE_POLL:
+            job_id, job_name, job_def_name = run.interface_job_id, "Interface Loader", INTERFACE_LOADER_JOB
+        else:
+            job_id, job_name, job_def_name = run.autoinvoice_job_id, "Auto Invoice Import", AUTOINVOICE_JOB
+        run_id = run.id
+        self.poller.track(job_id, job_name, job_def_name=job_def_name,
+                          callback=lambda status_info: self._job_done(run_id, step, status_info))
+
+    def _job_done(self, run_id, step, status_info):
+        with self.app.app_context():
+            try:
+                run = db.session.get(FbdiPipelineRun, run_id)
+                status = status_info.get('RequestStatus') if status_info else 'TIMEOUT'
+                if status not in SUCCESS_STATUSES:
+                    self._fail(run, step, status, 500)
+                elif step == STEP_INTERFACE_POLL:
+                    run.interface_status = status
+                else:
+                    run.autoinvoice_status = status
+                db.session.commit()
+            finally:
+                db.session.remove()
+        self.advance(run_id)
+
+    def _fail(self, run, step, error, error_code):
+        print(f"❌ Pipeline {run.id} failed at {step}: {error}")
+        run.status = RUN_FAILED
+        run.step = step
+        run.error = error
+        run.error_code = error_code
+
+    def _settle(self, run_id, result):
+        if result['status'] == RUN_RUNNING:
+            return
+        with self._lock:
+            future = self._waiters.pop(run_id, None)
+        if future and not future.done():
+            future.set_result(result)
+
+
+def cleanup_staged_uploads(app):
+    """Delete uploads of runs failed longer than FBDI_PIPELINE_FILE_TTL_SECONDS ago, and stray staged files.
+
+    A failed run keeps its upload until then so it can still be resumed; resuming it
+    afterwards fails with a 410.
+    """
+    ttl_seconds = app.config['FBDI_PIPELINE_FILE_TTL_SECONDS']
+    expired = FbdiPipelineRun.query.filter(
+        FbdiPipelineRun.status == RUN_FAILED,
+        FbdiPipelineRun.file_path.isnot(None),
+        FbdiPipelineRun.updated_at < utcnow() - timedelta(seconds=ttl_seconds)
+    ).all()
+    for run in expired:
+        try:
+            os.remove(run.file_path)
+        except FileNotFoundError:
+            pass
+        run.file_path = None
+    db.session.commit()
+
+    # Files no run references, e.g. from a start() that failed before its run was saved
+    path = app.config['FBDI_PIPELINE_DIR']
+    referenced = {p for (p,) in db.session.query(FbdiPipelineRun.file_path)
+                  .filter(FbdiPipelineRun.file_path.isnot(None)).all()}
+    removed = len(expired)
+    for name in os.listdir(path) if os.path.isdir(path) else ():
+        file_path = os.path.join(path, name)
+        try:
+            if file_path not in referenced and time.time() - os.path.getmtime(file_path) > ttl_seconds:
+                os.remove(file_path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        print(f"✓ Removed {removed} staged FBDI pipeline upload(s)")
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_fbdi_pipeline(app, client, poller, ucm_account):
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = FbdiPipeline(
+                app, client, poller, ucm_account,
+                app.config['FBDI_PIPELINE_DIR'],
+                lease_ttl_seconds=app.config.get('LEASE_TTL_SECONDS', 120)
+            )
+    return _pipeline
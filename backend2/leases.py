@@ -0,0 +1,46 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_
+from models import db
+
+# Identifies this worker process in LeaseMixin.owner
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def utcnow():
+    """Naive UTC, like the CURRENT_TIMESTAMP defaults of the models"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def lease_cutoff(ttl_seconds):
+    return utcnow() - timedelta(seconds=ttl_seconds)
+
+
+def lease_expired(model, ttl_seconds):
+    """Filter for rows no live process holds: never leased, or not renewed within ttl_seconds"""
+    return or_(model.heartbeat_at.is_(None), model.heartbeat_at < lease_cutoff(ttl_seconds))
+
+
+def take_lease(row):
+    """Lease a row this process is creating"""
+    row.owner = PROCESS_ID
+    row.heartbeat_at = utcnow()
+
+
+def claim(model, row_id, ttl_seconds):
+    """Atomically take over a row whose lease is ours or expired; True if this process now holds it"""
+    claimed = model.query.filter(
+        model.id == row_id,
+        or_(model.owner == PROCESS_ID, lease_expired(model, ttl_seconds))
+    ).update({model.owner: PROCESS_ID, model.heartbeat_at: utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def renew_leases(model, statuses):
+    """Heartbeat every row in statuses this process holds"""
+    model.query.filter(model.owner == PROCESS_ID, model.status.in_(statuses))\
+        .update({model.heartbeat_at: utcnow()}, synchronize_session=False)
+    db.session.commit()
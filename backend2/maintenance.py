@@ -0,0 +1,35 @@
+import threading
+import time
+from models import db
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _run(app, tasks, interval):
+    while True:
+        for task in tasks:
+            with app.app_context():
+                try:
+                    task(app)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ Maintenance task {task.__name__} failed: {e}")
+                finally:
+                    db.session.remove()
+        time.sleep(interval)
+
+
+def start_maintenance(app, tasks):
+    """Run each task(app) now and then every LEASE_HEARTBEAT_SECONDS on one daemon thread per process"""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(
+                target=_run,
+                args=(app, list(tasks), app.config.get('LEASE_HEARTBEAT_SECONDS', 30)),
+                name='maintenance',
+                daemon=True
+            )
+            _thread.start()
+    return _thread
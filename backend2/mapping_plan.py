@@ -0,0 +1,130 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from utils import format_date_for_column, is_date_column
+from template_registry import BU_COLUMN, TEMPLATE_SHEET
+
+PLAN_CACHE_SIZE = 64
+
+
+class MappingPlan:
+    """Precompiled column mapping from one raw header layout onto one FBDI template sheet.
+
+    Each step is (output column index, raw column index, format_dates). Compiling
+    resolves every raw_columns.index, is_date_column and Comments/*Buisness Unit Name
+    check once, so applying the plan to a batch only copies columns.
+    """
+
+    def __init__(self, sheet, raw_columns, stored_mappings):
+        self.sheet = sheet
+        self.steps = []
+        self.output_positions = [i for i in range(sheet.width) if i != sheet.bu_index]
+        # Child sheets (distributions, sales credits, ...) only get rows that carry data
+        self.skip_blank_rows = sheet.name != TEMPLATE_SHEET
+        has_bu_col = BU_COLUMN in raw_columns
+
+        for col_idx, template_col in enumerate(sheet.columns):
+            if pd.isna(template_col) or template_col == "" or col_idx == sheet.bu_index:
+                continue
+
+            if col_idx == sheet.comments_index and has_bu_col:
+                self.steps.append((col_idx, raw_columns.index(BU_COLUMN), False))
+                continue
+
+            if template_col in stored_mappings:
+                raw_col_name = stored_mappings[template_col]
+                if raw_col_name in raw_columns:
+                    # Apply date formatting to any column that might contain dates
+                    format_dates = is_date_column(template_col) or is_date_column(raw_col_name)
+                    self.steps.append((col_idx, raw_columns.index(raw_col_name), format_dates))
+
+    def build_columns(self, raw_data):
+        """Return one batch of output as a list of column arrays in CSV order.
+
+        Mapped columns are formatted straight into their own arrays and every unmapped
+        column shares a single blank array. The *Buisness Unit Name column is left out
+        by projecting output positions, so no padded frame is built or dropped from.
+        """
+        blank = np.full(raw_data.shape[0], "", dtype=object)
+        mapped = {}
+
+        for col_idx, raw_idx, format_dates in self.steps:
+            data = raw_data[raw_idx]
+            if format_dates:
+                data = format_date_for_column(data, self.sheet.columns[col_idx])
+            mapped[col_idx] = _csv_values(data)
+
+        if self.skip_blank_rows and mapped:
+            has_data = np.logical_or.reduce([values != "" for values in mapped.values()])
+            if not has_data.all():
+                blank = blank[has_data]
+                mapped = {pos: values[has_data] for pos, values in mapped.items()}
+
+        return [mapped.get(pos, blank) for pos in self.output_positions]
+
+    @property
+    def raw_positions(self):
+        """Raw column positions this plan reads"""
+        return {raw_idx for _, raw_idx, _ in self.steps}
+
+    def __repr__(self):
+        return f'<MappingPlan {self.sheet.name} steps={len(self.steps)}>'
+
+
+def _csv_values(series):
+    """Object array of a column's cell values with missing cells blanked, as to_csv writes them"""
+    values = series.astype(object).to_numpy()
+    return np.where(pd.isna(values), "", values)
+
+
+_plans = OrderedDict()
+_lock = threading.Lock()
+
+
+def header_signature(raw_columns):
+    return hashlib.sha1(repr(list(raw_columns)).encode()).hexdigest()
+
+
+def mapping_version(stored_mappings):
+    return hashlib.sha1(repr(sorted(stored_mappings.items())).encode()).hexdigest()
+
+
+def sheet_mappings_version(sheet_mappings):
+    """Version of a whole {sheet name: mappings} set"""
+    versions = sorted((name, mapping_version(mapping)) for name, mapping in sheet_mappings.items())
+    return hashlib.sha1(repr(versions).encode()).hexdigest()
+
+
+def get_mapping_plan(template, sheet, raw_columns, stored_mappings):
+    """Return the cached plan for (template sheet, raw header, mapping set), compiling it on a miss"""
+    key = (template.fbdi_type, template.mtime, sheet.name, header_signature(raw_columns), mapping_version(stored_mappings))
+
+    with _lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+
+    plan = MappingPlan(sheet, raw_columns, stored_mappings)
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def get_mapping_plans(template, raw_columns, sheet_mappings):
+    """Plans for every sheet to emit: always the lines sheet, plus any other sheet with a mapped column"""
+    plans = []
+    for name, sheet in template.sheets.items():
+        plan = get_mapping_plan(template, sheet, raw_columns, sheet_mappings.get(name, {}))
+        if sheet is template.primary or plan.steps:
+            plans.append(plan)
+    return plans
+
+
+def needed_raw_columns(plans):
+    """Sorted raw column positions read by any of the plans; the rest never need parsing"""
+    return sorted(set().union(*(plan.raw_positions for plan in plans)))
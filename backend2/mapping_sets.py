@@ -0,0 +1,151 @@
+import csv
+import io
+from models import db, ColumnMapping, MappingSet, ActiveMappingSet
+from utils import bump_mapping_version
+
+MAPPING_FIELDS = ['fbdi_module', 'fbdi_subset', 'template_column', 'raw_column', 'status']
+IMPORT_UPSERT = 'upsert'
+IMPORT_REPLACE = 'replace'
+IMPORT_MODES = (IMPORT_UPSERT, IMPORT_REPLACE)
+
+
+def export_mapping_rows(fbdi_module=None, mapping_set_id=None):
+    """Rows of one mapping set, or of every active set (optionally for one module), in one query"""
+    query = db.session.query(
+        ColumnMapping.mapping_set_id,
+        ColumnMapping.fbdi_module,
+        ColumnMapping.fbdi_subset,
+        ColumnMapping.template_column,
+        ColumnMapping.raw_column,
+        ColumnMapping.status
+    )
+    if mapping_set_id:
+        query = query.filter(ColumnMapping.mapping_set_id == mapping_set_id)
+    else:
+        query = query.join(ActiveMappingSet, ActiveMappingSet.mapping_set_id == ColumnMapping.mapping_set_id)
+        if fbdi_module:
+            query = query.filter(ActiveMappingSet.fbdi_module == fbdi_module)
+    rows = query.order_by(ColumnMapping.fbdi_module, ColumnMapping.fbdi_subset, ColumnMapping.id).all()
+    return [row._asdict() for row in rows]
+
+
+def rows_to_json(rows):
+    """Group flat mapping rows into {"mapping_sets": [...]}, one entry per set"""
+    mapping_sets = {}
+    for row in rows:
+        entry = mapping_sets.setdefault(row['mapping_set_id'], {
+            "mapping_set_id": row['mapping_set_id'],
+            "fbdi_module": row['fbdi_module'],
+            "fbdi_subset": row['fbdi_subset'],
+            "mappings": []
+        })
+        entry["mappings"].append({
+            "template_column": row['template_column'],
+            "raw_column": row['raw_column'],
+            "status": row['status']
+        })
+    return {"mapping_sets": list(mapping_sets.values())}
+
+
+def rows_to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MAPPING_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def rows_from_json(payload):
+    """Flatten an export-shaped {"mapping_sets": [...]} payload into mapping rows"""
+    rows = []
+    for mapping_set in payload.get('mapping_sets') or []:
+        for mapping in mapping_set.get('mappings') or []:
+            rows.append({
+                "fbdi_module": mapping_set.get('fbdi_module'),
+                "fbdi_subset": mapping_set.get('fbdi_subset'),
+                **mapping
+            })
+    return rows
+
+
+def rows_from_csv(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _group_rows(rows):
+    """Validate import rows into {(module, subset): {template_column: (raw_column, status)}}"""
+    grouped = {}
+    for line, row in enumerate(rows, start=1):
+        fbdi_module = (row.get('fbdi_module') or '').strip()
+        fbdi_subset = (row.get('fbdi_subset') or '').strip()
+        template_column = (row.get('template_column') or '').strip()
+        if not fbdi_module or not fbdi_subset or not template_column:
+            raise ValueError(f"Mapping {line}: fbdi_module, fbdi_subset and template_column are required")
+
+        raw_column = row.get('raw_column') or ''
+        status = (row.get('status') or ('Y' if raw_column else 'N')).strip().upper()
+        if status not in ('Y', 'N'):
+            raise ValueError(f"Mapping {line}: status must be Y or N, got '{status}'")
+        grouped.setdefault((fbdi_module, fbdi_subset), {})[template_column] = (raw_column, status)
+    return grouped
+
+
+def import_mapping_sets(rows, mode=IMPORT_UPSERT, source='import'):
+    """Store imported mappings as new active sets, one per (module, subset), in one transaction.
+
+    upsert merges the rows over the currently active set of each (module, subset);
+    replace makes the imported rows the whole set. Existing sets are never modified,
+    so an import can be rolled back by re-activating the previous set.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode '{mode}', expected one of {', '.join(IMPORT_MODES)}")
+
+    grouped = _group_rows(rows)
+    if not grouped:
+        raise ValueError("No mappings to import")
+    modules = {fbdi_module for fbdi_module, _ in grouped}
+
+    # Loads the active pointers into the session, so activate() needs no further queries
+    active = {
+        (pointer.fbdi_module, pointer.fbdi_subset): pointer.mapping_set_id
+        for pointer in ActiveMappingSet.query.filter(ActiveMappingSet.fbdi_module.in_(modules)).all()
+    }
+
+    merged = {key: {} for key in grouped}
+    if mode == IMPORT_UPSERT:
+        set_keys = {mapping_set_id: key for key, mapping_set_id in active.items() if key in grouped}
+        if set_keys:
+            existing = db.session.query(
+                ColumnMapping.mapping_set_id, ColumnMapping.template_column,
+                ColumnMapping.raw_column, ColumnMapping.status
+            ).filter(ColumnMapping.mapping_set_id.in_(set_keys)).order_by(ColumnMapping.id).all()
+            for mapping_set_id, template_column, raw_column, status in existing:
+                merged[set_keys[mapping_set_id]][template_column] = (raw_column, status)
+    for key, mappings in grouped.items():
+        merged[key].update(mappings)
+
+    mapping_sets = {key: MappingSet(fbdi_module=key[0], fbdi_subset=key[1], source=source) for key in merged}
+    db.session.add_all(mapping_sets.values())
+    db.session.flush()
+
+    db.session.bulk_insert_mappings(ColumnMapping, [
+        dict(
+            fbdi_module=fbdi_module,
+            fbdi_subset=fbdi_subset,
+            template_column=template_column,
+            raw_column=raw_column,
+            status=status,
+            mapping_set_id=mapping_sets[(fbdi_module, fbdi_subset)].id
+        )
+        for (fbdi_module, fbdi_subset), mappings in merged.items()
+        for template_column, (raw_column, status) in mappings.items()
+    ])
+    for mapping_set in mapping_sets.values():
+        mapping_set.activate()
+    bump_mapping_version()
+    db.session.commit()
+
+    return [
+        {**mapping_sets[key].to_dict(), "mappings": len(merged[key]), "imported": len(grouped[key])}
+        for key in merged
+    ]
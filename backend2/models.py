@@ -1,9 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 
 db = SQLAlchemy()
 
 class ColumnMapping(db.Model):
     __tablename__ = 'column_mapping'
+    __table_args__ = (
+        db.Index('ix_column_mapping_set_status', 'mapping_set_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     fbdi_module = db.Column(db.String(100), nullable=False)
@@ -12,6 +16,240 @@ class ColumnMapping(db.Model):
     raw_column = db.Column(db.String(100), nullable=True)
     status = db.Column(db.String(1), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    mapping_set_id = db.Column(db.Integer, db.ForeignKey('mapping_set.id'), nullable=True)
     
     def __repr__(self):
         return f'<ColumnMapping {self.template_column} -> {self.raw_column}>'
+
+
+class MappingVersion(db.Model):
+    """Single-row counter bumped by every column_mapping write, so readers in any
+    process can tell their cached mappings are stale"""
+    __tablename__ = 'mapping_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    @classmethod
+    def current(cls):
+        return db.session.query(cls.version).filter(cls.id == 1).scalar() or 0
+    
+    @classmethod
+    def bump(cls):
+        """Increment the counter inside the caller's transaction"""
+        updated = cls.query.filter(cls.id == 1).update({cls.version: cls.version + 1})
+        if not updated:
+            db.session.add(cls(id=1, version=1))
+    
+    def __repr__(self):
+        return f'<MappingVersion {self.version}>'
+
+
+class MappingSet(db.Model):
+    """One generated set of column mappings for an FBDI module/subset"""
+    __tablename__ = 'mapping_set'
+    __table_args__ = (
+        db.Index('ix_mapping_set_module_subset', 'fbdi_module', 'fbdi_subset', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fbdi_module = db.Column(db.String(100), nullable=False)
+    fbdi_subset = db.Column(db.String(100), nullable=False)
+    source = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    @classmethod
+    def start(cls, fbdi_module, fbdi_subset, source=None):
+        """Create a set in the caller's transaction and return it with its id assigned"""
+        mapping_set = cls(fbdi_module=fbdi_module, fbdi_subset=fbdi_subset, source=source)
+        db.session.add(mapping_set)
+        db.session.flush()
+        return mapping_set
+    
+    def activate(self):
+        """Point the set's (module, subset) at this set"""
+        pointer = db.session.get(ActiveMappingSet, (self.fbdi_module, self.fbdi_subset))
+        if pointer:
+            pointer.mapping_set_id = self.id
+        else:
+            db.session.add(ActiveMappingSet(
+                fbdi_module=self.fbdi_module,
+                fbdi_subset=self.fbdi_subset,
+                mapping_set_id=self.id
+            ))
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "fbdi_module": self.fbdi_module,
+            "fbdi_subset": self.fbdi_subset,
+            "source": self.source,
+            "created_at": self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<MappingSet {self.id} {self.fbdi_module}/{self.fbdi_subset}>'
+
+
+class ActiveMappingSet(db.Model):
+    """Active mapping set per (module, subset); the primary key is the lookup index"""
+    __tablename__ = 'active_mapping_set'
+    
+    fbdi_module = db.Column(db.String(100), primary_key=True)
+    fbdi_subset = db.Column(db.String(100), primary_key=True)
+    mapping_set_id = db.Column(db.Integer, db.ForeignKey('mapping_set.id'), nullable=False)
+    activated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<ActiveMappingSet {self.fbdi_module}/{self.fbdi_subset} -> {self.mapping_set_id}>'
+
+
+class LeaseMixin:
+    """Process currently responsible for a row, and when it last confirmed it is alive (see leases.py)"""
+    owner = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+
+class FbdiJob(LeaseMixin, db.Model):
+    __tablename__ = 'fbdi_job'
+    
+    id = db.Column(db.String(36), primary_key=True)
+    fbdi_type = db.Column(db.String(100), nullable=False)
+    project_name = db.Column(db.String(200), nullable=True)
+    env_type = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='QUEUED')
+    rows_written = db.Column(db.Integer, nullable=True)
+    artifact_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "fbdi_type": self.fbdi_type,
+            "project_name": self.project_name,
+            "env_type": self.env_type,
+            "status": self.status,
+            "rows_written": self.rows_written,
+            "error": self.error,
+            "created_at": self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            "updated_at": self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<FbdiJob {self.id} {self.status}>'
+
+
+class FbdiPipelineRun(LeaseMixin, db.Model):
+    """One upload -> Interface Loader -> AutoInvoice run, with the Oracle IDs of each finished step"""
+    __tablename__ = 'fbdi_pipeline_run'
+    __table_args__ = (
+        db.Index('ix_fbdi_pipeline_run_status', 'status'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='RUNNING')
+    step = db.Column(db.String(30), nullable=False, default='upload')
+    file_path = db.Column(db.String(500), nullable=True)
+    ucm_filename = db.Column(db.String(200), nullable=True)
+    business_unit = db.Column(db.String(50), nullable=False)
+    batch_source = db.Column(db.String(200), nullable=False)
+    gl_date = db.Column(db.String(20), nullable=False)
+    document_id = db.Column(db.String(50), nullable=True)
+    interface_job_id = db.Column(db.String(50), nullable=True)
+    interface_status = db.Column(db.String(20), nullable=True)
+    autoinvoice_job_id = db.Column(db.String(50), nullable=True)
+    autoinvoice_status = db.Column(db.String(20), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    error_code = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def to_dict(self):
+        return {
+            "pipeline_id": self.id,
+            "status": self.status,
+            "step": self.step,
+            "ucm_filename": self.ucm_filename,
+            "business_unit": self.business_unit,
+            "batch_source": self.batch_source,
+            "gl_date": self.gl_date,
+            "document_id": self.document_id,
+            "interface_job_id": self.interface_job_id,
+            "interface_status": self.interface_status,
+            "autoinvoice_job_id": self.autoinvoice_job_id,
+            "autoinvoice_status": self.autoinvoice_status,
+            "error": self.error,
+            "error_code": self.error_code,
+            "created_at": self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            "updated_at": self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<FbdiPipelineRun {self.id} {self.step} {self.status}>'
+
+
+class EssJobRun(db.Model):
+    """Finished ESS job, kept to learn typical runtimes per JobDefName"""
+    __tablename__ = 'ess_job_run'
+    __table_args__ = (
+        db.Index('ix_ess_job_run_def_finished', 'job_def_name', 'finished_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_def_name = db.Column(db.String(200), nullable=False)
+    request_id = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    duration_seconds = db.Column(db.Float, nullable=False)
+    finished_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<EssJobRun {self.job_def_name} {self.request_id} {self.duration_seconds:.0f}s>'
+
+
+def upgrade_mapping_schema():
+    """Bring a column_mapping table created before mapping sets up to date.
+
+    db.create_all() neither adds columns nor indexes to existing tables, so the set
+    column and indexes are added in place. Legacy rows are grouped into one active set
+    per (module, subset), which resolves to the same mappings as before.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('column_mapping')}
+    if 'mapping_set_id' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE column_mapping ADD COLUMN mapping_set_id INTEGER REFERENCES mapping_set(id)'))
+    for index in ColumnMapping.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+    legacy = db.session.query(ColumnMapping.fbdi_module, ColumnMapping.fbdi_subset)\
+        .filter(ColumnMapping.mapping_set_id.is_(None)).distinct().all()
+    for fbdi_module, fbdi_subset in legacy:
+        mapping_set = MappingSet.start(fbdi_module, fbdi_subset, source='legacy')
+        ColumnMapping.query.filter(
+            ColumnMapping.fbdi_module == fbdi_module,
+            ColumnMapping.fbdi_subset == fbdi_subset,
+            ColumnMapping.mapping_set_id.is_(None)
+        ).update({ColumnMapping.mapping_set_id: mapping_set.id}, synchronize_session=False)
+        if not db.session.get(ActiveMappingSet, (fbdi_module, fbdi_subset)):
+            mapping_set.activate()
+    if legacy:
+        MappingVersion.bump()
+        print(f"✓ Grouped legacy column mappings into {len(legacy)} mapping set(s)")
+    db.session.commit()
+
+
+def upgrade_lease_columns():
+    """Add the LeaseMixin columns to tables created before leases existed"""
+    inspector = inspect(db.engine)
+    for model in (FbdiJob, FbdiPipelineRun):
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        with db.engine.begin() as conn:
+            if 'owner' not in columns:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN owner VARCHAR(100)'))
+            if 'heartbeat_at' not in columns:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN heartbeat_at DATETIME'))
@@ -0,0 +1,149 @@
+import base64
+import json
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ERP_CONTENT_TYPE = 'application/vnd.oracle.adf.resourceitem+json'
+RETRY_STATUSES = (429, 502, 503, 504)
+# Multiple of 3 bytes, so each chunk encodes to base64 without padding
+UPLOAD_CHUNK_SIZE = 3 * 256 * 1024
+
+
+class Base64JsonBody:
+    """JSON request body whose one string field is a file, base64-encoded as it is sent.
+
+    Holds one chunk of the file and its encoding at a time, however large the file.
+    The encoded length is known up front, so requests sends a Content-Length header
+    rather than chunked transfer encoding. Iterating again restarts from the file's
+    original position, so a connection retry resends the whole body.
+    """
+
+    def __init__(self, fields, content_field, fileobj, chunk_size=UPLOAD_CHUNK_SIZE):
+        if chunk_size % 3:
+            raise ValueError("chunk_size must be a multiple of 3")
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.start = fileobj.tell()
+        self.size = fileobj.seek(0, os.SEEK_END) - self.start
+        fileobj.seek(self.start)
+
+        # Fields first, then the file content as the last (string) value
+        self.head = (json.dumps(fields)[:-1] + (', ' if fields else '') + json.dumps(content_field) + ': "').encode()
+        self.tail = b'"}'
+
+    def __len__(self):
+        return len(self.head) + 4 * ((self.size + 2) // 3) + len(self.tail)
+
+    def __iter__(self):
+        self.fileobj.seek(self.start)
+        yield self.head
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+        yield self.tail
+
+
+class OracleErpClient:
+    """Oracle ERP Cloud erpintegrations REST client on one pooled, keep-alive session.
+
+    Upload, job submission and status polling share the session's connection pool,
+    so after the first call every request reuses an open TLS connection to the pod.
+    Failed connects are retried for any method since nothing was sent. Read errors
+    and 429/5xx responses are only retried for GET: resending an upload or job
+    submission could duplicate it in Oracle.
+    """
+
+    def __init__(self, base_url, username, password, ess_service_url, pool_size=10, max_retries=3, backoff_factor=0.5):
+        self.url = base_url.rstrip('/') + '/' + ess_service_url.lstrip('/')
+        self.session = requests.Session()
+
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.session.headers.update({
+            'Authorization': f'Basic {token}',
+            'Content-Type': ERP_CONTENT_TYPE,
+            'Connection': 'keep-alive'
+        })
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'GET'}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, payload, timeout=30, **kwargs):
+        """POST an operation payload to erpintegrations"""
+        return self.session.post(self.url, json=payload, timeout=timeout, **kwargs)
+
+    def upload_file_to_ucm(self, document_content, file_name, document_account, content_type='zip', timeout=60):
+        return self.post({
+            "OperationName":   "uploadFileToUCM",
+            "DocumentContent": document_content,
+            "DocumentAccount": document_account,
+            "ContentType":     content_type,
+            "FileName":        file_name,
+            "DocumentId":      None
+        }, timeout=timeout)
+
+    def upload_stream_to_ucm(self, fileobj, file_name, document_account, content_type='zip', timeout=60):
+        """uploadFileToUCM from an open binary file, base64-encoded chunk by chunk into the body"""
+        body = Base64JsonBody({
+            "OperationName":   "uploadFileToUCM",
+            "DocumentAccount": document_account,
+            "ContentType":     content_type,
+            "FileName":        file_name,
+            "DocumentId":      None
+        }, "DocumentContent", fileobj)
+        return self.session.post(self.url, data=body, timeout=timeout)
+
+    def submit_ess_job(self, job_package_name, job_def_name, ess_parameters, timeout=30):
+        return self.post({
+            "OperationName": "submitESSJobRequest",
+            "JobPackageName": job_package_name,
+            "JobDefName": job_def_name,
+            "ESSParameters": ess_parameters
+        }, timeout=timeout)
+
+    def get_job_status(self, request_id, timeout=30):
+        """GET the ESSJobStatusRF finder row for one ESS request"""
+        return self.session.get(
+            self.url,
+            params={'finder': f"ESSJobStatusRF;requestId={request_id}"},
+            timeout=timeout
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_oracle_client(app, cloud_config):
+    """Process-wide client for cloud_config, pooled per the app's ORACLE_HTTP_* settings"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OracleErpClient(
+                cloud_config['base_url'],
+                cloud_config['username'],
+                cloud_config['password'],
+                cloud_config['ess_service_url'],
+                pool_size=app.config.get('ORACLE_HTTP_POOL_SIZE', 10),
+                max_retries=app.config.get('ORACLE_HTTP_RETRIES', 3)
+            )
+    return _client
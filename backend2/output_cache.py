@@ -0,0 +1,119 @@
+import hashlib
+import os
+import shutil
+import threading
+from mapping_plan import sheet_mappings_version
+
+
+class FbdiOutputCache:
+    """Content-addressed, size-bounded disk cache of generated FBDI ZIPs.
+
+    Entries are keyed by the raw file bytes, the template bytes and the active mapping
+    set, so an unchanged regeneration is served without parsing anything. File mtimes
+    track recency; the least recently used entries are evicted once the cache grows
+    past max_bytes. Hit/miss counters are per process.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, raw_hash, template, sheet_mappings):
+        parts = f"{raw_hash}:{template.content_hash}:{sheet_mappings_version(sheet_mappings)}"
+        return hashlib.sha256(parts.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.zip")
+
+    def get(self, key):
+        """Return the cached ZIP path for key, or None on a miss"""
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self.hits += 1
+                return path
+            self.misses += 1
+            return None
+
+    def put(self, key, zip_path):
+        """Move a finished ZIP into the cache and return its cached path"""
+        path = self._path(key)
+        shutil.move(zip_path, path)
+        self._evict()
+        return path
+
+    def store_stream(self, key, chunks):
+        """Pass a streamed ZIP through while copying it into the cache.
+
+        The entry is only published once the stream completes; an abandoned or
+        failed stream leaves nothing behind.
+        """
+        partial_path = f"{self._path(key)}.{threading.get_ident()}.part"
+        completed = False
+        try:
+            with open(partial_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            self.put(key, partial_path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".zip"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_output_cache(app):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FbdiOutputCache(app.config['FBDI_CACHE_DIR'], app.config['FBDI_CACHE_MAX_BYTES'])
+    return _cache
@@ -0,0 +1,129 @@
+import random
+import statistics
+from abc import ABC, abstractmethod
+from models import db, EssJobRun
+
+STRATEGY_FIXED = 'fixed'
+STRATEGY_BACKOFF = 'backoff'
+STRATEGY_ADAPTIVE = 'adaptive'
+STRATEGIES = (STRATEGY_FIXED, STRATEGY_BACKOFF, STRATEGY_ADAPTIVE)
+
+HISTORY_SAMPLE = 20
+HISTORY_MIN_RUNS = 3
+
+
+def _jittered(delay, jitter, cap):
+    # Jitter after capping, so jobs that reached the cap do not all poll in lockstep
+    delay = min(delay, cap)
+    if jitter:
+        delay *= random.uniform(1 - jitter, 1 + jitter)
+    return delay
+
+
+class PollStrategy(ABC):
+    """Seconds to wait before the next status check of an ESS job"""
+
+    @abstractmethod
+    def next_delay(self, attempt, elapsed):
+        """Delay after check number attempt (from 0), elapsed seconds after tracking started"""
+
+    def describe(self):
+        return type(self).__name__
+
+
+class FixedInterval(PollStrategy):
+    def __init__(self, interval=10):
+        self.interval = interval
+
+    def next_delay(self, attempt, elapsed):
+        return self.interval
+
+    def describe(self):
+        return f"fixed {self.interval}s"
+
+
+class ExponentialBackoff(PollStrategy):
+    """initial * factor**attempt capped at max_interval, then +/- jitter so jobs submitted together spread out"""
+
+    def __init__(self, initial=2, factor=2, max_interval=60, jitter=0.2):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+    def next_delay(self, attempt, elapsed):
+        return _jittered(self.initial * self.factor ** attempt, self.jitter, self.max_interval)
+
+    def describe(self):
+        return f"backoff {self.initial}s x{self.factor} up to {self.max_interval}s"
+
+
+class DurationAware(PollStrategy):
+    """Polls sparsely until a job nears its expected runtime, densely around it, then backs off.
+
+    The dense window is expected * (1 +/- window). A job that overruns the window is
+    checked at half its overrun, so a run that takes twice as long as usual costs a
+    few extra calls rather than one every dense_interval.
+    """
+
+    def __init__(self, expected, dense_interval=2, window=0.2, max_interval=60, jitter=0.2):
+        self.expected = expected
+        self.dense_interval = dense_interval
+        self.window = window
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+    def next_delay(self, attempt, elapsed):
+        window_start = self.expected * (1 - self.window)
+        window_end = self.expected * (1 + self.window)
+        if elapsed < window_start:
+            delay = window_start - elapsed
+        elif elapsed <= window_end:
+            delay = self.dense_interval
+        else:
+            delay = (elapsed - self.expected) / 2
+        return _jittered(max(self.dense_interval, delay), self.jitter, self.max_interval)
+
+    def describe(self):
+        return f"adaptive around {self.expected:.0f}s"
+
+
+def expected_duration(job_def_name):
+    """Median runtime of the last successful runs of job_def_name, or None without enough history"""
+    if not job_def_name:
+        return None
+    durations = [
+        duration for (duration,) in db.session.query(EssJobRun.duration_seconds)
+        .filter(EssJobRun.job_def_name == job_def_name, EssJobRun.status.in_(('SUCCEEDED', 'WARNING')))
+        .order_by(EssJobRun.finished_at.desc())
+        .limit(HISTORY_SAMPLE)
+        .all()
+    ]
+    if len(durations) < HISTORY_MIN_RUNS:
+        return None
+    return statistics.median(durations)
+
+
+def record_job_run(job_def_name, request_id, status, duration_seconds):
+    if not job_def_name:
+        return
+    db.session.add(EssJobRun(
+        job_def_name=job_def_name,
+        request_id=str(request_id),
+        status=status,
+        duration_seconds=duration_seconds
+    ))
+    db.session.commit()
+
+
+def strategy_for(config, job_def_name=None):
+    """Poll strategy per ESS_POLL_STRATEGY; adaptive falls back to backoff until a JobDefName has history"""
+    name = config.get('ESS_POLL_STRATEGY', STRATEGY_ADAPTIVE)
+    max_interval = config.get('ESS_POLL_MAX_INTERVAL', 60)
+    if name == STRATEGY_FIXED:
+        return FixedInterval(config.get('ESS_POLL_INTERVAL', 10))
+    if name == STRATEGY_ADAPTIVE:
+        expected = expected_duration(job_def_name)
+        if expected:
+            return DurationAware(expected, max_interval=max_interval)
+    return ExponentialBackoff(max_interval=max_interval)
@@ -0,0 +1,461 @@
+import codecs
+import json
+import posixpath
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from xml.etree.ElementTree import fromstring, iterparse
+import numpy as np
+import pandas as pd
+from excel_reader import OLE2_MAGIC, SheetRows, read_excel
+
+# Raw uploads carry a title row, then the header row, then data
+RAW_HEADER_ROW = 1
+RAW_BATCH_SIZE = 5000
+
+# Strings pd.read_excel treats as missing by default
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}
+
+RAW_FORMAT_XLSX = "xlsx"
+RAW_FORMAT_XLS = "xls"
+RAW_FORMAT_CSV = "csv"
+RAW_FORMAT_TSV = "tsv"
+RAW_FORMAT_PARQUET = "parquet"
+
+HEADER_CACHE_SIZE = 256
+
+# Parquet schema metadata key holding the original raw header (see upload_sessions)
+RAW_COLUMNS_METADATA_KEY = b"raw_columns"
+
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CELL_REF_PATTERN = re.compile(r"^([A-Z]+)")
+
+PARQUET_MAGIC = b"PAR1"
+SNIFF_BYTES = 64 * 1024
+
+# Delimited uploads are tried in this order; latin-1 decodes any bytes, so it always ends the search
+TEXT_ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+DECODE_CHUNK_SIZE = 1024 * 1024
+
+
+class RawFileError(ValueError):
+    """A raw upload whose content breaks the raw file layout; routes report it as a 400"""
+
+
+def detect_raw_format(path):
+    """Identify a raw upload from its content; uploads are stored without a trustworthy extension"""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+
+    if head.startswith(PARQUET_MAGIC):
+        return RAW_FORMAT_PARQUET
+    if head.startswith(OLE2_MAGIC):
+        return RAW_FORMAT_XLS
+    if zipfile.is_zipfile(path):
+        return RAW_FORMAT_XLSX
+
+    # Delimited text: tab-separated if the header lines carry more tabs than commas
+    lines = head.splitlines()[:RAW_HEADER_ROW + 2]
+    tabs = sum(line.count(b"\t") for line in lines)
+    commas = sum(line.count(b",") for line in lines)
+    return RAW_FORMAT_TSV if tabs > commas else RAW_FORMAT_CSV
+
+
+def detect_text_encoding(path):
+    """First of TEXT_ENCODINGS that decodes the whole file, e.g. cp1252 for Excel "CSV" exports"""
+    for encoding in TEXT_ENCODINGS[:-1]:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(DECODE_CHUNK_SIZE), b""):
+                    decoder.decode(block)
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return TEXT_ENCODINGS[-1]
+
+
+def _convert_cell(value):
+    """Match the cell conversions pd.read_excel applies with the openpyxl engine"""
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        return np.nan if value in NA_STRINGS else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _is_blank(row):
+    return all(v is None or v == "" for v in row)
+
+
+def _integral_floats_to_int(chunk):
+    """Apply _convert_cell's integral float -> int rule to the float columns of a batch"""
+    for col in chunk.columns:
+        values = chunk[col].to_numpy()
+        if values.dtype.kind != "f":
+            continue
+        converted = values.astype(object)
+        integral = np.isfinite(values) & (values == np.floor(values))
+        converted[integral] = values[integral].astype(np.int64)
+        converted[np.isnan(values)] = np.nan
+        chunk[col] = converted
+    return chunk
+
+
+def encode_raw_columns(columns):
+    """JSON form of a raw header; blank header cells become null"""
+    return json.dumps([None if pd.isna(c) else c if isinstance(c, (int, float, str)) else str(c) for c in columns])
+
+
+def decode_raw_columns(data):
+    return [np.nan if c is None else c for c in json.loads(data)]
+
+
+class RawFileStream:
+    """Streams a raw upload as a header row plus bounded row batches.
+
+    Every format follows the raw workbook convention of a title row, the header row,
+    then data, except Parquet whose schema names are the header. Batches are
+    DataFrames labelled by raw column position; batches(usecols) materializes only
+    the given positions:
+
+    - xlsx/xlsm: row iteration over the first sheet (openpyxl read-only unless engine says otherwise)
+    - csv/tsv: chunked pd.read_csv with all values kept as text, in the first of
+      TEXT_ENCODINGS that decodes the file; a row wider than the header is a RawFileError
+    - parquet: pyarrow record batches
+    - xls: full pd.read_excel sliced into batches (the format cannot be streamed)
+    """
+
+    def __init__(self, path, batch_size=RAW_BATCH_SIZE, engine=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.engine = engine
+        self.format = detect_raw_format(path)
+        self._workbook = None
+        self._frame = None
+        self._reader = None
+
+        if self.format == RAW_FORMAT_XLSX:
+            self._open_xlsx()
+        elif self.format in (RAW_FORMAT_CSV, RAW_FORMAT_TSV):
+            self._open_delimited()
+        elif self.format == RAW_FORMAT_PARQUET:
+            self._open_parquet()
+        else:
+            raw_df = read_excel(path, engine=engine, sheet_name=0, header=None)
+            self.columns = raw_df.iloc[RAW_HEADER_ROW].tolist() if len(raw_df) > RAW_HEADER_ROW else []
+            self._frame = raw_df.iloc[RAW_HEADER_ROW + 1:].reset_index(drop=True)
+
+        self.width = len(self.columns)
+
+    def _open_xlsx(self):
+        self._workbook = SheetRows(self.path, self.engine)
+        self._rows = self._workbook.rows
+        for _ in range(RAW_HEADER_ROW):
+            next(self._rows, None)
+        header = next(self._rows, None) or ()
+        self.columns = [_convert_cell(v) for v in header]
+        # Trailing empty header cells are padding, not columns
+        while self.columns and pd.isna(self.columns[-1]):
+            self.columns.pop()
+
+    def _read_delimited(self, **kwargs):
+        return pd.read_csv(
+            self.path,
+            sep="\t" if self.format == RAW_FORMAT_TSV else ",",
+            header=None,
+            dtype=str,
+            skip_blank_lines=False,
+            encoding=self._encoding,
+            **kwargs
+        )
+
+    def _open_delimited(self):
+        self._encoding = detect_text_encoding(self.path)
+        header = self._read_delimited(skiprows=RAW_HEADER_ROW, nrows=1)
+        self.columns = header.iloc[0].tolist() if not header.empty else []
+
+    def _open_parquet(self):
+        import pyarrow.parquet as pq
+        from session_cells import CELL_ENCODING_METADATA_KEY, CELL_ENCODING, decode_cells
+
+        self._reader = pq.ParquetFile(self.path)
+        schema = self._reader.schema_arrow
+        self._field_names = list(schema.names)
+        metadata = schema.metadata or {}
+        # Session caches of Excel/CSV uploads carry the original header; their cells
+        # get the same conversions as when the workbook is streamed directly
+        self._from_workbook = RAW_COLUMNS_METADATA_KEY in metadata
+        # Current session files keep each cell's type in a struct column
+        self._decode_cells = decode_cells if metadata.get(CELL_ENCODING_METADATA_KEY) == CELL_ENCODING else None
+        if self._from_workbook:
+            self.columns = decode_raw_columns(metadata[RAW_COLUMNS_METADATA_KEY])
+        else:
+            self.columns = list(self._field_names)
+
+    def _excel_batches(self, usecols):
+        positions = usecols if usecols is not None else range(self.width)
+        batch = []
+        pending_blank = 0
+        for row in self._rows:
+            if _is_blank(row):
+                # pd.read_excel keeps blank rows between data but drops trailing ones
+                pending_blank += 1
+                continue
+            for _ in range(pending_blank):
+                batch.append([np.nan] * len(positions))
+            pending_blank = 0
+
+            row_width = len(row)
+            batch.append([_convert_cell(row[i]) if i < row_width else np.nan for i in positions])
+
+            if len(batch) >= self.batch_size:
+                yield pd.DataFrame(batch, columns=positions, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=positions, dtype=object)
+
+    def _delimited_chunks(self):
+        # Rows are parsed one column wider than the header: a value in that column (or a
+        # parser error for even wider rows) means a row would lose fields. usecols would
+        # hide those fields, so it is applied to the chunks instead
+        self._reader = self._read_delimited(
+            skiprows=RAW_HEADER_ROW + 1,
+            names=range(self.width + 1),
+            index_col=False,
+            chunksize=self.batch_size
+        )
+        line = RAW_HEADER_ROW + 2
+        try:
+            for chunk in self._reader:
+                overflow = chunk[self.width].notna().to_numpy()
+                if overflow.any():
+                    raise RawFileError(
+                        f"Line {line + int(overflow.argmax())} has more fields than the {self.width} header columns")
+                line += len(chunk)
+                yield chunk.drop(columns=self.width)
+        except pd.errors.ParserError as e:
+            raise RawFileError(f"A data row has more fields than the {self.width} header columns: {e}") from e
+
+    def _delimited_batches(self, usecols):
+        if not self.columns:
+            return
+        pending_blank = 0
+        for chunk in self._delimited_chunks():
+            # pd.read_excel keeps blank rows between data but drops trailing ones
+            blank = chunk.isna().all(axis=1).to_numpy()
+            if blank.all():
+                pending_blank += len(chunk)
+                continue
+            data_rows = len(blank) - int(blank[::-1].argmin())
+            if pending_blank:
+                chunk = pd.concat([pd.DataFrame(np.nan, index=range(pending_blank), columns=chunk.columns, dtype=object),
+                                   chunk.iloc[:data_rows]])
+            else:
+                chunk = chunk.iloc[:data_rows]
+            pending_blank = len(blank) - data_rows
+
+            if usecols is not None:
+                chunk = chunk[usecols]
+            chunk = chunk.reset_index(drop=True)
+            for start in range(0, len(chunk), self.batch_size):
+                yield chunk.iloc[start:start + self.batch_size].reset_index(drop=True)
+
+    def _parquet_batches(self, usecols):
+        positions = usecols if usecols is not None else range(self.width)
+        names = [self._field_names[i] for i in positions] if usecols is not None else None
+        for record_batch in self._reader.iter_batches(batch_size=self.batch_size, columns=names):
+            if self._decode_cells:
+                chunk = pd.DataFrame({
+                    position: self._decode_cells(record_batch.column(idx)) for idx, position in enumerate(positions)
+                }, columns=positions)
+            else:
+                # Keep nullable integer columns as ints rather than widening them to float
+                chunk = record_batch.to_pandas(integer_object_nulls=True)
+                chunk.columns = positions
+            if self._from_workbook:
+                chunk = _integral_floats_to_int(chunk)
+            yield chunk
+
+    def _frame_batches(self, usecols):
+        frame = self._frame if usecols is None else self._frame[usecols]
+        for start in range(0, len(frame), self.batch_size):
+            yield frame.iloc[start:start + self.batch_size].reset_index(drop=True)
+
+    def batches(self, usecols=None):
+        """Yield data rows as DataFrames of at most batch_size rows, labelled by column position.
+
+        usecols is a sorted list of header positions to materialize; the other columns
+        are skipped by the parser where the format allows it and never converted.
+        """
+        if usecols is not None:
+            usecols = [i for i in usecols if i < self.width]
+        if self.format == RAW_FORMAT_XLSX:
+            return self._excel_batches(usecols)
+        if self.format in (RAW_FORMAT_CSV, RAW_FORMAT_TSV):
+            return self._delimited_batches(usecols)
+        if self.format == RAW_FORMAT_PARQUET:
+            return self._parquet_batches(usecols)
+        return self._frame_batches(usecols)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._reader is not None and hasattr(self._reader, "close"):
+            self._reader.close()
+        self._reader = None
+        self._frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _column_index(cell_ref):
+    letters = CELL_REF_PATTERN.match(cell_ref).group(1)
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _first_sheet_path(archive):
+    """Archive path of the first worksheet, resolved through workbook.xml and its rels"""
+    workbook = archive.read("xl/workbook.xml")
+    rels = archive.read("xl/_rels/workbook.xml.rels")
+    first_sheet = fromstring(workbook).find(f"{SHEET_NS}sheets/{SHEET_NS}sheet")
+    rel_id = first_sheet.get(f"{REL_NS}id")
+    for rel in fromstring(rels).iter(f"{PKG_REL_NS}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(f"Worksheet relationship {rel_id} not found")
+
+
+def _shared_strings(archive, wanted):
+    """Resolve only the shared string indices in wanted, stopping once the largest is read"""
+    if not wanted or "xl/sharedStrings.xml" not in archive.namelist():
+        return {}
+    last = max(wanted)
+    found = {}
+    index = 0
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, elem in iterparse(f, events=("end",)):
+            if elem.tag != f"{SHEET_NS}si":
+                continue
+            if index in wanted:
+                # Plain <t> or rich-text <r><t> runs; phonetic <rPh> runs are not displayed
+                found[index] = "".join(
+                    t.text or ""
+                    for child in elem if child.tag != f"{SHEET_NS}rPh"
+                    for t in child.iter(f"{SHEET_NS}t")
+                )
+            elem.clear()
+            if index >= last:
+                break
+            index += 1
+    return found
+
+
+def _sniff_xlsx_header(path):
+    """Read the header row of the first sheet by streaming its XML and stopping right after it.
+
+    Returns None when the header holds numeric cells, which need the workbook styles to
+    tell dates from numbers; the caller falls back to the row reader for those.
+    """
+    target_row = RAW_HEADER_ROW + 1
+    with zipfile.ZipFile(path) as archive:
+        cells = {}
+        with archive.open(_first_sheet_path(archive)) as f:
+            row_number = 0
+            for _, elem in iterparse(f, events=("end",)):
+                if elem.tag != f"{SHEET_NS}row":
+                    continue
+                row_number = int(elem.get("r", row_number + 1))
+                if row_number == target_row:
+                    for position, cell in enumerate(elem.iter(f"{SHEET_NS}c")):
+                        ref = cell.get("r")
+                        col = _column_index(ref) if ref else position
+                        value = cell.find(f"{SHEET_NS}v")
+                        if cell.get("t") == "inlineStr":
+                            text = "".join(t.text or "" for t in cell.iter(f"{SHEET_NS}t"))
+                            cells[col] = ("str", text)
+                        elif value is not None:
+                            cells[col] = (cell.get("t", "n"), value.text)
+                elem.clear()
+                if row_number >= target_row:
+                    break
+
+        # Whether a number is a date depends on the cell style, which is not parsed here
+        if any(cell_type == "n" for cell_type, _ in cells.values()):
+            return None
+
+        strings = _shared_strings(archive, {int(v) for t, v in cells.values() if t == "s"})
+
+    columns = [np.nan] * (max(cells) + 1 if cells else 0)
+    for col, (cell_type, text) in cells.items():
+        if cell_type == "s":
+            value = strings.get(int(text))
+        elif cell_type in ("str", "inlineStr"):
+            value = text
+        elif cell_type == "b":
+            value = text == "1"
+        elif cell_type == "d":
+            value = pd.Timestamp(text)
+        else:
+            # Error cells come through as their text, as openpyxl reports them
+            value = text
+        columns[col] = _convert_cell(value)
+
+    while columns and pd.isna(columns[-1]):
+        columns.pop()
+    return columns
+
+
+_headers = OrderedDict()
+_headers_lock = threading.Lock()
+
+
+def read_raw_header(path, file_hash=None):
+    """Return the raw header row without reading any data rows.
+
+    xlsx/xlsm headers come from streaming the first sheet's XML up to the header row,
+    so the cost does not grow with the workbook. Results are cached by file_hash.
+    """
+    if file_hash is not None:
+        with _headers_lock:
+            if file_hash in _headers:
+                _headers.move_to_end(file_hash)
+                return list(_headers[file_hash])
+
+    columns = None
+    if detect_raw_format(path) == RAW_FORMAT_XLSX:
+        try:
+            columns = _sniff_xlsx_header(path)
+        except Exception as e:
+            print(f"⚠️ Header sniffing failed for {path}, falling back to the row reader: {e}")
+    if columns is None:
+        with RawFileStream(path) as raw_stream:
+            columns = raw_stream.columns
+
+    if file_hash is not None:
+        with _headers_lock:
+            _headers[file_hash] = list(columns)
+            while len(_headers) > HEADER_CACHE_SIZE:
+                _headers.popitem(last=False)
+    return columns
@@ -7,6 +7,7 @@ import os
 from datetime import datetime
 import tempfile
 import uuid
+from excel_reader import read_excel
 
 # SOAP API Configuration (keeping your original config)
 SOAP_CONFIG = {
@@ -59,7 +60,7 @@ def fetch_target_data_via_soap():
             f.write(response.reportBytes)
         
         # Read with pandas
-        target_df = pd.read_excel(temp_file, engine='xlrd')
+        target_df = read_excel(temp_file)
         os.remove(temp_file)  # Cleanup
         
         print(f"✅ Target data fetched: {len(target_df)} records, {len(target_df.columns)} columns")
@@ -91,7 +92,7 @@ def generate_reconciliation_report():
         
         # Step 2: Read source data (SKIP FIRST ROW like your code)
         print("📊 Reading source data...")
-        raw_df = pd.read_excel(RAW_FILE_PATH, skiprows=1)
+        raw_df = read_excel(RAW_FILE_PATH, skiprows=1)
         
         # Clean column names
         raw_df.columns = raw_df.columns.str.strip()
@@ -315,7 +316,7 @@ class ReconciliationReportGenerator:
                 f.write(response.reportBytes)
             
             # Read with pandas
-            target_df = pd.read_excel(temp_file, engine='xlrd')
+            target_df = read_excel(temp_file)
             os.remove(temp_file)  # Cleanup
             
             print(f"✅ Target data fetched: {len(target_df)} records, {len(target_df.columns)} columns")
@@ -325,8 +326,12 @@ class ReconciliationReportGenerator:
             print(f"❌ SOAP Error: {str(e)}")
             raise Exception(f"Failed to fetch target data: {str(e)}")
 
-    def generate_reconciliation_report(self, raw_file_path, output_dir=None, request_id='31143'):
-        """Generate reconciliation report for Flask API"""
+    def generate_reconciliation_report(self, raw_file_path, output_dir=None, request_id='31143', raw_df=None):
+        """Generate reconciliation report for Flask API
+
+        raw_df, when given, is the already-parsed raw data (e.g. from an upload session)
+        and raw_file_path is not read.
+        """
         try:
             self.request_id = request_id  # Update request ID for this instance
             print("🚀 Starting Reconciliation Report Generation...")
@@ -348,7 +353,8 @@ class ReconciliationReportGenerator:
             
             # Step 2: Read source data
             print("📊 Reading source data...")
-            raw_df = pd.read_excel(raw_file_path, skiprows=1)
+            if raw_df is None:
+                raw_df = read_excel(raw_file_path, skiprows=1)
             
             # Clean column names
             raw_df.columns = raw_df.columns.str.strip()
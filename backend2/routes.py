@@ -1,12 +1,22 @@
-from flask import Blueprint, request, send_file, jsonify
+from flask import Blueprint, request, send_file, jsonify, Response, current_app
 import pandas as pd
 import tempfile
 import shutil
 import zipfile
-import io
+import json
 import os
-from models import ColumnMapping
-from utils import format_date_for_column, is_date_column, get_latest_mappings
+from models import db, ColumnMapping, MappingSet, ActiveMappingSet
+from utils import get_latest_mappings, get_sheet_mappings, file_sha256, copy_and_hash, bump_mapping_version
+from raw_reader import read_raw_header, RawFileError
+from fbdi_generator import open_fbdi_zip_stream, generate_fbdi_batch
+from template_registry import get_template, template_exists, TEMPLATE_SHEET
+from output_cache import get_output_cache
+from fbdi_jobs import submit_fbdi_job, get_job, JOB_SUCCEEDED
+from upload_sessions import get_session_store
+from mapping_sets import (
+    export_mapping_rows, rows_to_json, rows_to_csv, rows_from_json, rows_from_csv,
+    import_mapping_sets, IMPORT_UPSERT
+)
 from report_generator import get_execution_report_and_generate_pdf  # Add this import
 # Add these imports to your existing imports
 from werkzeug.utils import secure_filename
@@ -16,31 +26,91 @@ from reconreport import ReconciliationReportGenerator, generate_reconciliation_r
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    """Upload a raw file once; preview, generate and reconcile can then use its session_id"""
+    try:
+        raw_file = request.files.get('raw_file')
+        if not raw_file:
+            return jsonify({"error": "Missing raw file"}), 400
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw:
+            raw_hash = copy_and_hash(raw_file.stream, tmp_raw)
+        try:
+            session = get_session_store(current_app).create(tmp_raw.name, raw_hash, secure_filename(raw_file.filename or ""))
+        finally:
+            os.remove(tmp_raw.name)
+
+        return jsonify({"status": "success", "session": _session_json(session)}), 201
+
+    except RawFileError as e:
+        print(f"Rejected raw file in create_upload_session: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in create_upload_session: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/upload-sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Get the header and row count of an upload session"""
+    try:
+        session = get_session_store(current_app).get(session_id)
+        if not session:
+            return jsonify({"error": f"Upload session '{session_id}' not found or expired"}), 404
+        return jsonify({"status": "success", "session": _session_json(session)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/upload-sessions/<session_id>', methods=['DELETE'])
+def delete_upload_session(session_id):
+    """Drop an upload session before it expires"""
+    try:
+        if not get_session_store(current_app).delete(session_id):
+            return jsonify({"error": f"Upload session '{session_id}' not found or expired"}), 404
+        return jsonify({"status": "success"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _session_json(session):
+    return {
+        "session_id": session["session_id"],
+        "filename": session["filename"],
+        "source_format": session["source_format"],
+        "rows": session["rows"],
+        "columns": [None if pd.isna(c) else c for c in session["columns"]],
+        "expires_in": session["expires_in"]
+    }
+
 @main_bp.route('/preview-mappings', methods=['POST'])
 def preview_mappings():
     try:
         raw_file = request.files.get('raw_file')
+        session_id = request.form.get('session_id')
         fbdi_type = request.form.get('fbdi_type')
 
-        if not raw_file or not fbdi_type:
+        if not (raw_file or session_id) or not fbdi_type:
             return jsonify({"error": "Missing raw file or FBDI type"}), 400
 
-        template_path = f"templates/{fbdi_type}_template.xlsm"
-        if not os.path.exists(template_path):
+        if not template_exists(fbdi_type):
             return jsonify({"error": f"Template for type '{fbdi_type}' not found"}), 404
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".xlsm") as tmp_template:
-            shutil.copyfileobj(raw_file.stream, tmp_raw)
-            shutil.copyfile(template_path, tmp_template.name)
+        if session_id:
+            session = get_session_store(current_app).get(session_id)
+            if not session:
+                return jsonify({"error": f"Upload session '{session_id}' not found or expired"}), 404
+            raw_columns = session["columns"]
+        else:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw:
+                raw_hash = copy_and_hash(raw_file.stream, tmp_raw)
+            # Only the header row is read; repeat previews of the same file hit the header cache
+            raw_columns = read_raw_header(tmp_raw.name, raw_hash)
+            os.remove(tmp_raw.name)
 
-        template_df = pd.read_excel(tmp_template.name, sheet_name="RA_INTERFACE_LINES_ALL", header=None)
-        raw_df = pd.read_excel(tmp_raw.name, sheet_name=0, header=None)
+        template = get_template(fbdi_type)
 
-        template_columns = template_df.iloc[3].tolist()
-        raw_columns = raw_df.iloc[1].tolist()
+        template_columns = template.primary.columns
 
-        stored_mappings = get_latest_mappings()
+        stored_mappings = get_latest_mappings(fbdi_type, template.sheet_names, TEMPLATE_SHEET)
         mappings = []
 
         for template_col in template_columns:
@@ -58,9 +128,6 @@ def preview_mappings():
                 "raw_column": mapped_raw_col or "Not Mapped"
             })
 
-        os.remove(tmp_raw.name)
-        os.remove(tmp_template.name)
-
         return jsonify({"status": "success", "mappings": mappings})
 
     except Exception as e:
@@ -71,91 +138,316 @@ def preview_mappings():
 def generate_fbdi_from_type():
     try:
         raw_file = request.files.get('raw_file')
+        session_id = request.form.get('session_id')
         fbdi_type = request.form.get('fbdi_type')
         project_name = request.form.get('project_name')
         env_type = request.form.get('env_type')
 
         print(f"✓ Generating FBDI for: {fbdi_type}, Project={project_name}, Env={env_type}")
 
-        if not raw_file or not fbdi_type:
+        if not (raw_file or session_id) or not fbdi_type:
             return jsonify({"error": "Missing raw file or FBDI type"}), 400
 
-        template_path = f"templates/{fbdi_type}_template.xlsm"
-        if not os.path.exists(template_path):
+        if not template_exists(fbdi_type):
             return jsonify({"error": f"Template for type '{fbdi_type}' not found"}), 404
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".xlsm") as tmp_template:
-            shutil.copyfileobj(raw_file.stream, tmp_raw)
-            shutil.copyfile(template_path, tmp_template.name)
+        if session_id:
+            session = get_session_store(current_app).get(session_id)
+            if not session:
+                return jsonify({"error": f"Upload session '{session_id}' not found or expired"}), 404
+            raw_path, raw_hash = session["path"], session["raw_hash"]
+            cleanup = None
+        else:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw:
+                raw_hash = copy_and_hash(raw_file.stream, tmp_raw)
+            raw_path = tmp_raw.name
+            cleanup = lambda: os.remove(raw_path)
+
+        # Until the stream owns raw_path (and removes it on close), setup errors must remove it here
+        try:
+            template = get_template(fbdi_type)
+            sheet_mappings = get_sheet_mappings(template.sheet_names, TEMPLATE_SHEET, fbdi_type)
+
+            # Identical raw file, template and mappings: serve the stored ZIP
+            output_cache = get_output_cache(current_app)
+            cache_key = output_cache.key_for(raw_hash, template, sheet_mappings)
+            cached_zip = output_cache.get(cache_key)
+            if cached_zip:
+                if cleanup:
+                    cleanup()
+                print(f"✓ Serving cached FBDI output {cache_key[:12]}")
+                return send_file(
+                    cached_zip,
+                    mimetype='application/zip',
+                    as_attachment=True,
+                    download_name='fbdi_output.zip'
+                )
+
+            # Stream the ZIP to the client while raw batches are still being mapped
+            zip_stream = open_fbdi_zip_stream(
+                raw_path, template, sheet_mappings,
+                workers=current_app.config.get('FBDI_WORKERS', 1),
+                on_close=cleanup
+            )
+        except Exception:
+            if cleanup and os.path.exists(raw_path):
+                cleanup()
+            raise
 
-        # Read files without automatically parsing dates
-        template_df = pd.read_excel(tmp_template.name, sheet_name="RA_INTERFACE_LINES_ALL", header=None)
-        raw_df = pd.read_excel(tmp_raw.name, sheet_name=0, header=None)
+        return Response(
+            output_cache.store_stream(cache_key, zip_stream),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=fbdi_output.zip'}
+        )
 
-        template_columns = template_df.iloc[3].tolist()
-        raw_columns = raw_df.iloc[1].tolist()
-        raw_data = raw_df.iloc[2:].reset_index(drop=True)
+    except Exception as e:
+        print(f"Error in generate_fbdi_from_type: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        start_row = 4
-        num_rows = raw_data.shape[0]
+@main_bp.route('/generate-fbdi-batch', methods=['POST'])
+def generate_fbdi_batch_endpoint():
+    """Generate FBDI ZIPs for many raw files at once and return them as a ZIP of ZIPs"""
+    try:
+        raw_files = [f for f in request.files.getlist('raw_files') if f and f.filename]
+        fbdi_type = request.form.get('fbdi_type')
 
-        if template_df.shape[0] < start_row + num_rows:
-            empty_rows = pd.DataFrame([[""] * template_df.shape[1]] * (start_row + num_rows - template_df.shape[0]))
-            template_df = pd.concat([template_df, empty_rows], ignore_index=True)
+        if not raw_files or not fbdi_type:
+            return jsonify({"error": "Missing raw files or FBDI type"}), 400
 
-        stored_mappings = get_latest_mappings()
-        has_bu_col = "*Buisness Unit Name" in raw_columns
+        if not template_exists(fbdi_type):
+            return jsonify({"error": f"Template for type '{fbdi_type}' not found"}), 404
 
-        for col_idx, template_col in enumerate(template_columns):
-            if pd.isna(template_col) or template_col == "" or template_col == "*Buisness Unit Name":
-                continue
-            
-            if template_col == "Comments" and has_bu_col:
-                raw_idx = raw_columns.index("*Buisness Unit Name")
-                template_df.iloc[start_row:start_row + num_rows, col_idx] = raw_data.iloc[:, raw_idx].values
-                continue
-            
-            if template_col in stored_mappings:
-                raw_col_name = stored_mappings[template_col]
-                if raw_col_name in raw_columns:
-                    raw_idx = raw_columns.index(raw_col_name)
-                    data = raw_data.iloc[:, raw_idx]
-                    
-                    # Apply date formatting to any column that might contain dates
-                    if is_date_column(template_col) or is_date_column(raw_col_name):
-                        print(f"Formatting dates for column: {template_col}")
-                        data = format_date_for_column(data, template_col)
-                    
-                    template_df.iloc[start_row:start_row + num_rows, col_idx] = data.values
-
-        if "*Buisness Unit Name" in template_columns:
-            col_idx = template_columns.index("*Buisness Unit Name")
-            template_df = template_df.drop(columns=col_idx, axis=1)
-
-        final_df = template_df.iloc[start_row:start_row + num_rows]
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_csv:
-            # Ensure no automatic date parsing when saving to CSV
-            final_df.to_csv(tmp_csv.name, index=False, header=False, date_format='%Y/%m/%d')
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(tmp_csv.name, arcname="RaInterfaceLinesAll.csv")
-            zip_buffer.seek(0)
-
-        os.remove(tmp_raw.name)
-        os.remove(tmp_template.name)
-        os.remove(tmp_csv.name)
+        work_dir = tempfile.mkdtemp(prefix="fbdi_batch_")
+        try:
+            template = get_template(fbdi_type)
+            sheet_mappings = get_sheet_mappings(template.sheet_names, TEMPLATE_SHEET, fbdi_type)
+            output_cache = get_output_cache(current_app)
+
+            outputs = []
+            pending = []
+            for idx, raw_file in enumerate(raw_files):
+                stem = os.path.splitext(secure_filename(raw_file.filename))[0] or f"raw_{idx + 1}"
+                raw_path = os.path.join(work_dir, f"{idx}_raw")
+                raw_file.save(raw_path)
+
+                cache_key = output_cache.key_for(file_sha256(raw_path), template, sheet_mappings)
+                zip_path = output_cache.get(cache_key)
+                if not zip_path:
+                    zip_path = os.path.join(work_dir, f"{idx}_fbdi.zip")
+                    pending.append((raw_path, zip_path, cache_key))
+                outputs.append((f"{idx + 1:02d}_{stem}_fbdi.zip", zip_path))
+
+            print(f"✓ Batch FBDI for {fbdi_type}: {len(raw_files)} files, {len(pending)} to generate")
+            generate_fbdi_batch(
+                [(raw_path, zip_path) for raw_path, zip_path, _ in pending],
+                template, sheet_mappings,
+                workers=current_app.config.get('FBDI_BATCH_WORKERS', 1)
+            )
+            for _, zip_path, cache_key in pending:
+                shutil.copyfile(zip_path, zip_path + ".cache")
+                output_cache.put(cache_key, zip_path + ".cache")
+
+            # Inner archives are already deflated, so store them as-is
+            bundle_path = os.path.join(work_dir, "fbdi_batch_output.zip")
+            with zipfile.ZipFile(bundle_path, "w", zipfile.ZIP_STORED) as bundle:
+                for arcname, zip_path in outputs:
+                    bundle.write(zip_path, arcname=arcname)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+        response = send_file(
+            bundle_path,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name='fbdi_batch_output.zip'
+        )
+        response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+        return response
+
+    except RawFileError as e:
+        print(f"Rejected raw file in generate_fbdi_batch_endpoint: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in generate_fbdi_batch_endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/generate-fbdi-from-type/async', methods=['POST'])
+def generate_fbdi_from_type_async():
+    """Queue FBDI generation and return a job ID immediately"""
+    try:
+        raw_file = request.files.get('raw_file')
+        session_id = request.form.get('session_id') or request.form.get('sessionId')
+        fbdi_type = request.form.get('fbdi_type')
+        project_name = request.form.get('project_name')
+        env_type = request.form.get('env_type')
+
+        if not (raw_file or session_id) or not fbdi_type:
+            return jsonify({"error": "Missing raw file or FBDI type"}), 400
+
+        if not template_exists(fbdi_type):
+            return jsonify({"error": f"Template for type '{fbdi_type}' not found"}), 404
+
+        # The job owns (and deletes) its raw file, so a session is copied rather than
+        # read in place where expiry or eviction could remove it mid-job
+        raw_hash = None
+        if session_id:
+            session = get_session_store(current_app).get(session_id)
+            if not session:
+                return jsonify({"error": f"Upload session '{session_id}' not found or expired"}), 404
+            raw_hash = session["raw_hash"]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".parquet") as tmp_raw:
+                with open(session["path"], 'rb') as session_file:
+                    shutil.copyfileobj(session_file, tmp_raw)
+        else:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_raw:
+                shutil.copyfileobj(raw_file.stream, tmp_raw)
+
+        job_id = submit_fbdi_job(current_app._get_current_object(), tmp_raw.name, fbdi_type, project_name, env_type,
+                                 raw_hash=raw_hash)
+        print(f"✓ Queued FBDI job {job_id} for: {fbdi_type}, Project={project_name}, Env={env_type}")
+
+        return jsonify({
+            "status": "accepted",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result"
+        }), 202
+
+    except Exception as e:
+        print(f"Error in generate_fbdi_from_type_async: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_fbdi_job_status(job_id):
+    """Get the state of an async FBDI job"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": f"Job '{job_id}' not found"}), 404
+        return jsonify({"status": "success", "job": job.to_dict()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def download_fbdi_job_result(job_id):
+    """Download the ZIP produced by a finished async FBDI job"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"error": f"Job '{job_id}' not found"}), 404
+        if job.status != JOB_SUCCEEDED:
+            return jsonify({"error": f"Job is {job.status}", "job": job.to_dict()}), 409
+        if not job.artifact_path or not os.path.exists(job.artifact_path):
+            return jsonify({"error": "Job output has expired; submit the file again", "job": job.to_dict()}), 410
 
         return send_file(
-            zip_buffer,
+            job.artifact_path,
             mimetype='application/zip',
             as_attachment=True,
             download_name='fbdi_output.zip'
         )
+    except Exception as e:
+        print(f"Error in download_fbdi_job_result: {e}")
+        return jsonify({"error": str(e)}), 500
 
+@main_bp.route('/mapping-sets', methods=['GET'])
+def list_mapping_sets():
+    """Mapping set history for an FBDI type (module), newest first, flagging the active sets"""
+    try:
+        fbdi_type = request.args.get('fbdi_type')
+        query = MappingSet.query
+        if fbdi_type:
+            query = query.filter(MappingSet.fbdi_module == fbdi_type)
+        active_ids = {pointer.mapping_set_id for pointer in ActiveMappingSet.query.all()}
+
+        mapping_sets = []
+        for mapping_set in query.order_by(MappingSet.created_at.desc(), MappingSet.id.desc()).all():
+            entry = mapping_set.to_dict()
+            entry["active"] = mapping_set.id in active_ids
+            mapping_sets.append(entry)
+        return jsonify({"status": "success", "mapping_sets": mapping_sets})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/mapping-sets/<int:mapping_set_id>/activate', methods=['POST'])
+def activate_mapping_set(mapping_set_id):
+    """Make an earlier (or newer) mapping set the active one for its module/subset"""
+    try:
+        mapping_set = db.session.get(MappingSet, mapping_set_id)
+        if not mapping_set:
+            return jsonify({"error": f"Mapping set {mapping_set_id} not found"}), 404
+
+        mapping_set.activate()
+        bump_mapping_version()
+        db.session.commit()
+        return jsonify({"status": "success", "mapping_set": mapping_set.to_dict()})
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in activate_mapping_set: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/mapping-sets/export', methods=['GET'])
+def export_mapping_sets():
+    """Export the active mapping sets (or one set) as JSON or CSV"""
+    try:
+        rows = export_mapping_rows(
+            fbdi_module=request.args.get('fbdi_type'),
+            mapping_set_id=request.args.get('mapping_set_id', type=int)
+        )
+        if request.args.get('format', 'json').lower() == 'csv':
+            return Response(
+                rows_to_csv(rows),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=mapping_sets.csv'}
+            )
+        return jsonify({"status": "success", **rows_to_json(rows)})
+    except Exception as e:
+        print(f"Error in export_mapping_sets: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/mapping-sets/import', methods=['POST'])
+def import_mapping_sets_endpoint():
+    """Import mapping sets from a JSON body or an uploaded JSON/CSV file.
+
+    Each (module, subset) in the import becomes a new active set; mode=upsert (default)
+    merges over the current active set, mode=replace uses the imported rows alone.
+    """
+    try:
+        mappings_file = request.files.get('mappings_file')
+        if mappings_file:
+            mode = request.form.get('mode', IMPORT_UPSERT)
+            content = mappings_file.read().decode('utf-8-sig')
+            if (mappings_file.filename or '').lower().endswith('.json'):
+                rows = rows_from_json(json.loads(content))
+            else:
+                rows = rows_from_csv(content)
+        else:
+            payload = request.get_json(silent=True)
+            if not payload:
+                return jsonify({"error": "Provide a mappings_file upload or a JSON body"}), 400
+            mode = payload.get('mode', IMPORT_UPSERT)
+            rows = rows_from_json(payload)
+
+        try:
+            imported = import_mapping_sets(rows, mode=mode)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+
+        print(f"✓ Imported {len(imported)} mapping set(s) ({mode})")
+        return jsonify({"status": "success", "mode": mode, "mapping_sets": imported})
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in import_mapping_sets_endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@main_bp.route('/fbdi-cache/stats', methods=['GET'])
+def fbdi_cache_stats():
+    """Hit/miss counters and size of the generated FBDI output cache"""
+    try:
+        return jsonify({"status": "success", "cache": get_output_cache(current_app).stats()})
     except Exception as e:
-        print(f"Error in generate_fbdi_from_type: {e}")
         return jsonify({"error": str(e)}), 500
 
 @main_bp.route('/test-db')
@@ -355,8 +647,20 @@ def generate_reconciliation_report_class():
             }), 400
         print("🚀 Starting reconciliation report generation using class approach...")
         
-        # Verify that the predefined raw file exists
-        if not os.path.exists(RAW_FILE_PATH):
+        # An upload session replaces the predefined raw file and is not re-parsed
+        session_id = request_data.get('sessionId')
+        raw_df = None
+        if session_id:
+            session_store = get_session_store(current_app)
+            session = session_store.get(session_id)
+            if not session:
+                return jsonify({
+                    'status': 'error',
+                    'error': f"Upload session '{session_id}' not found or expired"
+                }), 404
+            raw_df = session_store.load_frame(session)
+        elif not os.path.exists(RAW_FILE_PATH):
+            # Verify that the predefined raw file exists
             return jsonify({
                 'status': 'error',
                 'error': f'Predefined raw file not found at: {RAW_FILE_PATH}'
@@ -366,7 +670,7 @@ def generate_reconciliation_report_class():
         generator = ReconciliationReportGenerator(SOAP_CONFIG)
         
         # Generate report using the class method
-        result = generator.generate_reconciliation_report(RAW_FILE_PATH, tempfile.gettempdir(), request_id=request_id)
+        result = generator.generate_reconciliation_report(RAW_FILE_PATH, tempfile.gettempdir(), request_id=request_id, raw_df=raw_df)
         
         if result['status'] == 'success':
             print(f"✅ Reconciliation report generated successfully: {result['output_filename']}")
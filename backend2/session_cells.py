@@ -0,0 +1,113 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Upload session files store every raw column as a struct with one field per cell type,
+# so a column mixing e.g. date serials and dates reads back exactly as it was parsed
+CELL_ENCODING_METADATA_KEY = b"cell_encoding"
+CELL_ENCODING = b"typed-v1"
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+CELL_FIELDS = [
+    pa.field("s", pa.string()),
+    pa.field("i", pa.int64()),
+    pa.field("f", pa.float64()),
+    pa.field("t", pa.timestamp("us")),
+    pa.field("b", pa.bool_()),
+    # Integers beyond int64, as decimal text
+    pa.field("n", pa.string()),
+]
+CELL_TYPE = pa.struct(CELL_FIELDS)
+
+
+def _is_missing(value):
+    return value is None or value is pd.NaT or (isinstance(value, float) and value != value)
+
+
+def _single_field(name, array):
+    children = [array if field.name == name else pa.nulls(len(array), field.type) for field in CELL_FIELDS]
+    return pa.StructArray.from_arrays(children, fields=CELL_FIELDS)
+
+
+def _fast_field(array):
+    """Struct field a uniformly typed Arrow array fits in, or None"""
+    kind = array.type
+    if pa.types.is_null(kind) or pa.types.is_string(kind) or pa.types.is_large_string(kind):
+        return "s", array.cast(pa.string())
+    if pa.types.is_integer(kind) and kind != pa.uint64():
+        return "i", array.cast(pa.int64())
+    if pa.types.is_floating(kind):
+        return "f", array.cast(pa.float64())
+    if pa.types.is_timestamp(kind) and kind.tz is None:
+        return "t", array.cast(pa.timestamp("us"))
+    if pa.types.is_boolean(kind):
+        return "b", array
+    return None
+
+
+def _encode_per_cell(values):
+    columns = {field.name: [None] * len(values) for field in CELL_FIELDS}
+    for idx, value in enumerate(values):
+        if _is_missing(value):
+            continue
+        if isinstance(value, (bool, np.bool_)):
+            columns["b"][idx] = bool(value)
+        elif isinstance(value, (int, np.integer)):
+            value = int(value)
+            if INT64_MIN <= value <= INT64_MAX:
+                columns["i"][idx] = value
+            else:
+                columns["n"][idx] = str(value)
+        elif isinstance(value, (float, np.floating)):
+            columns["f"][idx] = float(value)
+        elif isinstance(value, datetime) and value.tzinfo is None:
+            columns["t"][idx] = value
+        elif isinstance(value, str):
+            columns["s"][idx] = value
+        else:
+            columns["s"][idx] = str(value)
+    children = [pa.array(columns[field.name], type=field.type) for field in CELL_FIELDS]
+    return pa.StructArray.from_arrays(children, fields=CELL_FIELDS)
+
+
+def encode_cells(series):
+    """One batch of a raw column as a CELL_TYPE array, keeping each cell's own type.
+
+    Uniform columns convert in one Arrow call. Columns that mix types (or hold
+    integers beyond int64) are encoded cell by cell, so nothing is coerced to text.
+    """
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return _encode_per_cell(series.tolist())
+    fast = _fast_field(array)
+    if fast is None:
+        return _encode_per_cell(series.tolist())
+    return _single_field(*fast)
+
+
+def _field_values(name, child):
+    if name == "n":
+        return np.array([None if v is None else int(v) for v in child.to_pylist()], dtype=object)
+    # Nullable ints stay ints and timestamps stay datetime, as the workbook reader yields them
+    return child.to_pandas(integer_object_nulls=True, timestamp_as_object=True).to_numpy()
+
+
+def decode_cells(column):
+    """A CELL_TYPE array as a Series of cell values; missing cells are NaN"""
+    if isinstance(column, pa.ChunkedArray):
+        column = pa.concat_arrays(column.chunks) if column.num_chunks != 1 else column.chunk(0)
+    present = [field.name for field in CELL_FIELDS if column.field(field.name).null_count < len(column)]
+    if len(present) == 1:
+        decoded = _field_values(present[0], column.field(present[0]))
+    else:
+        decoded = np.full(len(column), np.nan, dtype=object)
+        for name in present:
+            child = column.field(name)
+            valid = child.is_valid().to_numpy(zero_copy_only=False)
+            decoded[valid] = _field_values(name, child)[valid]
+    # An explicit dtype stops pandas inferring datetime64 from a column of datetimes
+    return pd.Series(decoded, dtype=decoded.dtype)
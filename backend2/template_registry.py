@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+from utils import file_sha256
+from excel_reader import read_excel
+
+TEMPLATE_DIR = "templates"
+TEMPLATE_SHEET = "RA_INTERFACE_LINES_ALL"
+TEMPLATE_HEADER_ROW = 3
+BU_COLUMN = "*Buisness Unit Name"
+COMMENTS_COLUMN = "Comments"
+
+# Interface table sheets (RA_INTERFACE_LINES_ALL, AR_INTERFACE_CONTS_ALL, ...),
+# as opposed to the instructions sheet
+INTERFACE_SHEET_PATTERN = re.compile(r'^[A-Z][A-Z0-9_]+$')
+
+
+def csv_name_for_sheet(sheet_name):
+    """FBDI CSV file name for an interface sheet, e.g. RA_INTERFACE_LINES_ALL -> RaInterfaceLinesAll.csv"""
+    return "".join(part.capitalize() for part in sheet_name.split("_")) + ".csv"
+
+
+class FbdiSheet:
+    """Parsed layout of one interface sheet in an FBDI template"""
+
+    def __init__(self, name, columns, width):
+        self.name = name
+        self.csv_name = csv_name_for_sheet(name)
+        self.columns = columns
+        self.width = width
+        self.bu_index = None
+        self.comments_index = None
+
+        # The *Buisness Unit Name -> Comments swap only applies to the lines sheet
+        if name == TEMPLATE_SHEET:
+            self.bu_index = columns.index(BU_COLUMN) if BU_COLUMN in columns else None
+            self.comments_index = columns.index(COMMENTS_COLUMN) if COMMENTS_COLUMN in columns else None
+
+    def __repr__(self):
+        return f'<FbdiSheet {self.name} width={self.width}>'
+
+
+class FbdiTemplate:
+    """Parsed layout of every interface sheet in one FBDI template"""
+
+    def __init__(self, fbdi_type, path, mtime, content_hash, sheets):
+        self.fbdi_type = fbdi_type
+        self.path = path
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.sheets = sheets
+        self.primary = sheets[TEMPLATE_SHEET]
+
+    @property
+    def sheet_names(self):
+        return list(self.sheets)
+
+    def __repr__(self):
+        return f'<FbdiTemplate {self.fbdi_type} sheets={len(self.sheets)}>'
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def template_path(fbdi_type):
+    return os.path.join(TEMPLATE_DIR, f"{fbdi_type}_template.xlsm")
+
+
+def template_exists(fbdi_type):
+    return os.path.exists(template_path(fbdi_type))
+
+
+def _parse_template(fbdi_type, path, mtime):
+    sheets = {}
+    for name, sheet_df in read_excel(path, sheet_name=None, header=None).items():
+        if not INTERFACE_SHEET_PATTERN.match(name) or sheet_df.shape[0] <= TEMPLATE_HEADER_ROW:
+            continue
+        sheets[name] = FbdiSheet(name, sheet_df.iloc[TEMPLATE_HEADER_ROW].tolist(), sheet_df.shape[1])
+
+    if TEMPLATE_SHEET not in sheets:
+        raise ValueError(f"Template {path} has no {TEMPLATE_SHEET} sheet")
+
+    # Lines first, then the remaining sheets in workbook order
+    sheets = {TEMPLATE_SHEET: sheets.pop(TEMPLATE_SHEET), **sheets}
+    print(f"✓ Parsed template {path} ({', '.join(sheets)})")
+    return FbdiTemplate(fbdi_type, path, mtime, file_sha256(path), sheets)
+
+
+def get_template(fbdi_type):
+    """Return the parsed template for an FBDI type, re-parsing only when the file changes"""
+    path = template_path(fbdi_type)
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = _templates.get(fbdi_type)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+
+    with _lock:
+        cached = _templates.get(fbdi_type)
+        if cached is None or cached.mtime != mtime:
+            cached = _parse_template(fbdi_type, path, mtime)
+            _templates[fbdi_type] = cached
+    return cached
+
+
+def clear_templates():
+    with _lock:
+        _templates.clear()
@@ -0,0 +1,35 @@
+import pytest
+import utils
+from utils import get_latest_mappings, get_sheet_mappings, clear_mapping_cache
+
+LINES = "RA_INTERFACE_LINES_ALL"
+DISTRIBUTIONS = "RA_INTERFACE_DISTRIBUTIONS_ALL"
+SHEETS = (LINES, DISTRIBUTIONS, "RA_INTERFACE_SALESCREDITS_ALL")
+
+# Newest first, as _query_active_rows returns them; "Amount" is a column of both sheets
+ROWS = [
+    ("Amount", "Line Amount", LINES),
+    ("Transaction Number", "Invoice", "AR"),
+    ("Amount", "Dist Amount", DISTRIBUTIONS),
+    ("Percent", "Dist Percent", DISTRIBUTIONS),
+]
+
+
+@pytest.fixture(autouse=True)
+def active_rows(monkeypatch):
+    clear_mapping_cache()
+    monkeypatch.setattr(utils, "_active_mapping_rows", lambda fbdi_module=None: (1, ROWS))
+    yield
+    clear_mapping_cache()
+
+
+def test_child_sheet_mappings_stay_off_the_lines_sheet():
+    sheet_mappings = get_sheet_mappings(SHEETS, LINES, "AR")
+
+    assert sheet_mappings[LINES] == {"Amount": "Line Amount", "Transaction Number": "Invoice"}
+    assert sheet_mappings[DISTRIBUTIONS] == {"Amount": "Dist Amount", "Percent": "Dist Percent"}
+    assert sheet_mappings["RA_INTERFACE_SALESCREDITS_ALL"] == {}
+
+
+def test_latest_mappings_match_the_lines_sheet():
+    assert get_latest_mappings("AR", SHEETS, LINES) == get_sheet_mappings(SHEETS, LINES, "AR")[LINES]
@@ -0,0 +1,23 @@
+from poll_strategies import ExponentialBackoff, DurationAware
+
+
+def test_backoff_at_the_cap_stays_jittered():
+    strategy = ExponentialBackoff(initial=2, factor=2, max_interval=60, jitter=0.2)
+    delays = [strategy.next_delay(attempt, 0) for attempt in range(20, 60)]
+
+    assert all(48 <= delay <= 72 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_backoff_without_jitter_grows_to_the_cap():
+    strategy = ExponentialBackoff(initial=2, factor=2, max_interval=60, jitter=0)
+
+    assert [strategy.next_delay(attempt, 0) for attempt in range(7)] == [2, 4, 8, 16, 32, 60, 60]
+
+
+def test_overrunning_job_is_jittered_at_the_cap():
+    strategy = DurationAware(expected=100, max_interval=60, jitter=0.2)
+    delays = [strategy.next_delay(0, 1000) for _ in range(40)]
+
+    assert all(48 <= delay <= 72 for delay in delays)
+    assert len(set(delays)) > 1
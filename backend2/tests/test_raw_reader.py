@@ -0,0 +1,113 @@
+from datetime import date, datetime
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from excel_reader import SheetRows, ENGINE_AUTO, ENGINE_CALAMINE, ENGINE_OPENPYXL, engine_available
+from raw_reader import RawFileStream, RawFileError
+
+requires_calamine = pytest.mark.skipif(not engine_available(ENGINE_CALAMINE), reason="python-calamine not installed")
+
+
+@pytest.fixture
+def raw_path(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Raw extract"])
+    ws.append(["Transaction Date", "Amount", "Reference", None, "Reference"])
+    ws.append([datetime(2024, 1, 2), 10.5, "INV-1", None, 7])
+    ws.append([date(2024, 1, 3), 3.0, "N/A", None, "x"])
+    ws.append([None, None, None, None, None])
+    ws.append(["2024-01-04", -2, True, 45000, ""])
+    ws.append([None, None, None, None, None])
+    path = tmp_path / "raw.xlsx"
+    wb.save(path)
+    return str(path)
+
+
+def _read(path, engine):
+    with RawFileStream(path, batch_size=2, engine=engine) as raw_stream:
+        return raw_stream.columns, list(raw_stream.batches())
+
+
+def _cells(batches):
+    frame = pd.concat(batches, ignore_index=True)
+    return [[None if pd.isna(v) else (type(v), v) for v in row] for row in frame.itertuples(index=False)]
+
+
+@pytest.mark.parametrize("engine", [None, ENGINE_AUTO])
+def test_row_streaming_defaults_to_openpyxl(raw_path, engine):
+    rows = SheetRows(raw_path, engine)
+    try:
+        assert rows.engine == ENGINE_OPENPYXL
+    finally:
+        rows.close()
+
+
+@requires_calamine
+def test_calamine_streams_the_same_batches_as_openpyxl(raw_path):
+    openpyxl_columns, openpyxl_batches = _read(raw_path, ENGINE_OPENPYXL)
+    calamine_columns, calamine_batches = _read(raw_path, ENGINE_CALAMINE)
+
+    assert calamine_columns[0] == openpyxl_columns[0] == "Transaction Date"
+    assert [None if pd.isna(c) else c for c in calamine_columns] == \
+        [None if pd.isna(c) else c for c in openpyxl_columns]
+    assert [len(b) for b in calamine_batches] == [len(b) for b in openpyxl_batches]
+    assert _cells(calamine_batches) == _cells(openpyxl_batches)
+
+
+def test_streamed_rows_match_read_excel(raw_path):
+    _, batches = _read(raw_path, ENGINE_OPENPYXL)
+    expected = pd.read_excel(raw_path, skiprows=1, engine="openpyxl")
+
+    assert len(pd.concat(batches)) == len(expected)
+    assert [type(v) for v in pd.concat(batches, ignore_index=True)[0].dropna()] == [datetime, datetime, str]
+
+
+def _csv(tmp_path, content):
+    path = tmp_path / "raw.csv"
+    path.write_bytes(content)
+    return str(path)
+
+
+def _rows(path, batch_size=2, usecols=None):
+    with RawFileStream(path, batch_size=batch_size) as raw_stream:
+        frames = list(raw_stream.batches(usecols))
+    return [[None if pd.isna(v) else v for v in row] for frame in frames for row in frame.values.tolist()]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+@pytest.mark.parametrize("usecols", [None, [0]])
+def test_csv_row_wider_than_header_is_rejected(tmp_path, batch_size, usecols):
+    path = _csv(tmp_path, b"Raw extract\na,b,c\n1,2,3\n4,5,6,7\n")
+
+    with pytest.raises(RawFileError, match="Line 4"):
+        _rows(path, batch_size, usecols)
+
+
+def test_csv_trailing_delimiter_is_not_a_field(tmp_path):
+    path = _csv(tmp_path, b"Raw extract\na,b,c\n1,2,3,\n4,5,6\n")
+
+    assert _rows(path) == [["1", "2", "3"], ["4", "5", "6"]]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+def test_csv_trailing_blank_lines_are_dropped(tmp_path, batch_size):
+    path = _csv(tmp_path, b"Raw extract\na,b,c\n1,2,3\n\n4,5\n,,\n\n\n")
+
+    # Blank rows between data are kept, as pd.read_excel and the xlsx path keep them
+    assert _rows(path, batch_size) == [["1", "2", "3"], [None, None, None], ["4", "5", None]]
+    assert _rows(path, batch_size, usecols=[1]) == [["2"], [None], ["5"]]
+
+
+def test_csv_falls_back_to_cp1252(tmp_path):
+    path = _csv(tmp_path, "Raw extract\nName,City\nJosé,München €\n".encode("cp1252"))
+
+    with RawFileStream(path) as raw_stream:
+        assert raw_stream.columns == ["Name", "City"]
+    assert _rows(path) == [["José", "München €"]]
+
+
+def test_csv_utf8_with_bom(tmp_path):
+    path = _csv(tmp_path, "Raw extract\nName,City\nJosé,München\n".encode("utf-8-sig"))
+
+    assert _rows(path) == [["José", "München"]]
@@ -0,0 +1,130 @@
+import os
+import zipfile
+from datetime import datetime
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from raw_reader import RawFileStream
+from upload_sessions import UploadSessionStore
+from session_cells import encode_cells, decode_cells
+from template_registry import get_template, TEMPLATE_SHEET
+from fbdi_generator import write_fbdi_zip
+
+HEADER = ["Transaction Date", "Big Number", "Mixed", "Amount", "Empty", "Reference"]
+ROWS = [
+    [45000, 10 ** 20, "abc", 10.5, None, "INV-1"],
+    [datetime(2024, 1, 2), 12345678901234567890, 7, 3, None, "INV-2"],
+    [None, None, None, None, None, None],
+    ["2024-01-03", 2, True, 2.25, None, "INV-3"],
+    [datetime(2024, 2, 29, 13, 45), -5, 1.5, 0, None, 42],
+]
+
+
+def _write_workbook(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Raw extract"])
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def _cells(frame):
+    """Each cell with its type, so 7 and "7" or 1 and True do not compare equal"""
+    return [[None if pd.isna(v) else (type(v), v) for v in row] for row in frame.itertuples(index=False)]
+
+
+def _read(path, batch_size=2):
+    with RawFileStream(path, batch_size=batch_size) as raw_stream:
+        return raw_stream.columns, pd.concat(list(raw_stream.batches()), ignore_index=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadSessionStore(str(tmp_path / "sessions"), ttl_seconds=3600, max_bytes=10 ** 9)
+
+
+@pytest.fixture
+def raw_path(tmp_path):
+    return _write_workbook(str(tmp_path / "raw.xlsx"), ROWS)
+
+
+def test_session_reads_back_like_the_workbook(store, raw_path):
+    session = store.create(raw_path, "hash", "raw.xlsx")
+    assert session["rows"] == len(ROWS)
+    assert session["source_format"] == "xlsx"
+
+    file_columns, file_frame = _read(raw_path)
+    session_columns, session_frame = _read(session["path"])
+
+    assert session_columns == file_columns == HEADER
+    assert _cells(session_frame) == _cells(file_frame)
+
+
+def test_mixed_columns_keep_per_cell_types(store, raw_path):
+    _, frame = _read(store.create(raw_path, "hash")["path"])
+
+    assert [type(v) for v in frame[2].dropna()] == [str, int, bool, float]
+    assert frame.loc[0, 0] == 45000
+    assert frame.loc[1, 0] == datetime(2024, 1, 2)
+    assert frame.loc[3, 0] == "2024-01-03"
+    assert frame.loc[4, 5] == 42
+
+
+def test_integers_beyond_int64_survive():
+    values = [10 ** 20, 5, None, -12345678901234567890, "x"]
+    decoded = decode_cells(encode_cells(pd.Series(values, dtype=object)))
+
+    assert [None if pd.isna(v) else (type(v), v) for v in decoded] == \
+        [None if v is None else (type(v), v) for v in values]
+
+
+def test_datetime_batches_stay_datetime(store, raw_path):
+    # The last batch holds a single all-datetime date cell
+    _, frame = _read(store.create(raw_path, "hash")["path"])
+
+    assert type(frame.loc[4, 0]) is datetime
+
+
+def test_load_frame_matches_read_excel(store, raw_path):
+    frame = store.load_frame(store.create(raw_path, "hash"))
+    expected = pd.read_excel(raw_path, skiprows=1, engine="openpyxl")
+
+    assert list(frame.columns) == list(expected.columns)
+    assert frame.shape == expected.shape
+
+
+def test_csv_session_keeps_text(store, tmp_path):
+    raw_path = tmp_path / "raw.csv"
+    raw_path.write_text("Raw extract\nReference,Amount\n007,1.50\nINV-2,\n")
+    session = store.create(str(raw_path), "hash")
+
+    _, file_frame = _read(str(raw_path))
+    _, session_frame = _read(session["path"])
+
+    assert session["source_format"] == "csv"
+    assert _cells(session_frame) == _cells(file_frame)
+    assert session_frame.loc[0, 0] == "007"
+
+
+def test_fbdi_output_is_identical_from_session(store, raw_path, tmp_path):
+    template = get_template("AR")
+    sheet_mappings = {TEMPLATE_SHEET: {
+        "Transaction Date": "Transaction Date",
+        "Transaction Number": "Reference",
+        "Payment Terms": "Mixed",
+        "Business Unit Identifier": "Big Number",
+    }}
+    session = store.create(raw_path, "hash")
+
+    file_zip = str(tmp_path / "file.zip")
+    session_zip = str(tmp_path / "session.zip")
+    assert write_fbdi_zip(raw_path, template, file_zip, sheet_mappings, batch_size=2) == len(ROWS)
+    assert write_fbdi_zip(session["path"], template, session_zip, sheet_mappings, batch_size=2) == len(ROWS)
+
+    with zipfile.ZipFile(file_zip) as expected, zipfile.ZipFile(session_zip) as actual:
+        assert actual.namelist() == expected.namelist()
+        for name in expected.namelist():
+            assert actual.read(name) == expected.read(name)
@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from raw_reader import RawFileStream, RAW_COLUMNS_METADATA_KEY, encode_raw_columns, decode_raw_columns
+from session_cells import CELL_TYPE, CELL_ENCODING_METADATA_KEY, CELL_ENCODING, encode_cells
+
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _frame_header(columns):
+    """Column labels as pd.read_excel assigns them from a header row"""
+    names = []
+    seen = {}
+    for idx, col in enumerate(columns):
+        name = f"Unnamed: {idx}" if pd.isna(col) else col
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(name if count == 0 else f"{name}.{count}")
+    return names
+
+
+class UploadSessionStore:
+    """Raw uploads parsed once and kept as Parquet under a session ID.
+
+    Preview, generation and reconciliation read the session file instead of a fresh
+    upload. The original header is stored in the Parquet schema metadata, so
+    RawFileStream reads a session file like any raw upload. Sessions expire ttl
+    seconds after their last use, and the least recently used are evicted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, session_dir, ttl_seconds, max_bytes):
+        self.session_dir = session_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(session_dir, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.session_dir, f"{session_id}.parquet")
+
+    def create(self, raw_path, raw_hash, filename=None):
+        """Parse a raw upload into a new session and return its info"""
+        session_id = uuid.uuid4().hex
+        path = self._path(session_id)
+        partial_path = path + ".part"
+
+        rows = 0
+        try:
+            # Each raw batch is written as its own row group, so only one batch is in memory
+            with RawFileStream(raw_path) as raw_stream:
+                columns = raw_stream.columns
+                schema = pa.schema(
+                    [pa.field(f"c{idx}", CELL_TYPE) for idx in range(len(columns))],
+                    metadata={
+                        RAW_COLUMNS_METADATA_KEY: encode_raw_columns(columns),
+                        CELL_ENCODING_METADATA_KEY: CELL_ENCODING,
+                        b"raw_hash": raw_hash,
+                        b"filename": filename or "",
+                        b"source_format": raw_stream.format
+                    }
+                )
+                with pq.ParquetWriter(partial_path, schema) as writer:
+                    for raw_data in raw_stream.batches():
+                        writer.write_table(pa.Table.from_arrays(
+                            [encode_cells(raw_data[idx]) for idx in range(len(columns))],
+                            schema=schema
+                        ))
+                        rows += len(raw_data)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        print(f"✓ Upload session {session_id}: {rows} rows, {len(columns)} columns")
+        self._evict()
+        return self.get(session_id)
+
+    def _expired(self, mtime):
+        return time.time() - mtime > self.ttl_seconds
+
+    def get(self, session_id):
+        """Session info (path, header, raw hash, rows), or None if unknown or expired.
+
+        Looking a session up counts as using it and extends its lifetime.
+        """
+        if not SESSION_ID_PATTERN.match(session_id or ""):
+            return None
+        path = self._path(session_id)
+        with self._lock:
+            try:
+                if self._expired(os.stat(path).st_mtime):
+                    os.remove(path)
+                    return None
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.schema_arrow.metadata
+        return {
+            "session_id": session_id,
+            "path": path,
+            "columns": decode_raw_columns(metadata[RAW_COLUMNS_METADATA_KEY]),
+            "raw_hash": metadata[b"raw_hash"].decode(),
+            "filename": metadata[b"filename"].decode(),
+            "source_format": metadata[b"source_format"].decode(),
+            "rows": parquet_file.metadata.num_rows,
+            "expires_in": self.ttl_seconds
+        }
+
+    def load_frame(self, session):
+        """The session's rows as pd.read_excel(raw, skiprows=1) would return them"""
+        with RawFileStream(session["path"]) as raw_stream:
+            batches = list(raw_stream.batches())
+        if batches:
+            frame = pd.concat(batches, ignore_index=True)
+        else:
+            frame = pd.DataFrame(columns=range(len(session["columns"])))
+        frame.columns = _frame_header(session["columns"])
+        return frame
+
+    def delete(self, session_id):
+        if not SESSION_ID_PATTERN.match(session_id or ""):
+            return False
+        try:
+            os.remove(self._path(session_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.session_dir):
+                if not name.endswith(".parquet"):
+                    continue
+                path = os.path.join(self.session_dir, name)
+                try:
+                    st = os.stat(path)
+                    if self._expired(st.st_mtime):
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store(app):
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadSessionStore(
+                app.config['UPLOAD_SESSION_DIR'],
+                app.config['UPLOAD_SESSION_TTL_SECONDS'],
+                app.config['UPLOAD_SESSION_MAX_BYTES']
+            )
+    return _store
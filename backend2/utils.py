@@ -1,56 +1,257 @@
+import hashlib
+import threading
 import pandas as pd
 from datetime import datetime
-from models import ColumnMapping
+from models import db, ColumnMapping, MappingVersion, ActiveMappingSet
 
-def format_date_for_column(data_series, column_name):
-    def format_single_date(date_value):
-        if pd.isna(date_value) or date_value == "" or date_value is None:
-            return date_value
-        try:
-            # Handle different input types
-            if isinstance(date_value, str):
-                # Try different string formats
-                for fmt in ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d/%m/%Y', '%m-%d-%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S']:
-                    try:
-                        parsed_date = datetime.strptime(date_value, fmt)
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    # If no format matches, try pandas to_datetime
-                    try:
-                        parsed_date = pd.to_datetime(date_value)
-                    except:
-                        return date_value
-            elif isinstance(date_value, (datetime, pd.Timestamp)):
-                parsed_date = date_value
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d/%m/%Y', '%m-%d-%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S']
+OUTPUT_DATE_FORMAT = '%Y/%m/%d'
+DATE_SAMPLE_SIZE = 200
+
+
+def format_single_date(date_value):
+    if pd.isna(date_value) or date_value == "" or date_value is None:
+        return date_value
+    try:
+        # Handle different input types
+        if isinstance(date_value, str):
+            # Try different string formats
+            for fmt in DATE_FORMATS:
+                try:
+                    parsed_date = datetime.strptime(date_value, fmt)
+                    break
+                except ValueError:
+                    continue
             else:
-                # Try to convert using pandas
+                # If no format matches, try pandas to_datetime
                 try:
                     parsed_date = pd.to_datetime(date_value)
                 except:
                     return date_value
-            
-            # Always format as YYYY/MM/DD (date only, no time)
-            return parsed_date.strftime('%Y/%m/%d')
-            
-        except Exception as e:
-            print(f"Error formatting date {date_value}: {e}")
-            return date_value
-    
-    return data_series.apply(format_single_date)
+        elif isinstance(date_value, (datetime, pd.Timestamp)):
+            parsed_date = date_value
+        else:
+            # Try to convert using pandas
+            try:
+                parsed_date = pd.to_datetime(date_value)
+            except:
+                return date_value
+
+        # Always format as YYYY/MM/DD (date only, no time)
+        return parsed_date.strftime(OUTPUT_DATE_FORMAT)
+
+    except Exception as e:
+        print(f"Error formatting date {date_value}: {e}")
+        return date_value
+
+
+def detect_date_format(strings):
+    """Return the DATE_FORMATS entry that parses most of the sample, or None"""
+    best_fmt, best_hits = None, 0
+    for fmt in DATE_FORMATS:
+        hits = pd.to_datetime(strings, format=fmt, errors='coerce').notna().sum()
+        if hits > best_hits:
+            best_fmt, best_hits = fmt, hits
+    return best_fmt
+
+
+def _parse_date_strings(strings):
+    """Parse a Series of strings with the same per-value format priority as format_single_date"""
+    dominant = detect_date_format(strings.iloc[:DATE_SAMPLE_SIZE])
+    if dominant is None:
+        return pd.Series(pd.NaT, index=strings.index, dtype='datetime64[ns]')
+
+    parsed = pd.to_datetime(strings, format=dominant, errors='coerce')
+
+    # Formats ranked above the dominant one still win where they also match
+    for fmt in reversed(DATE_FORMATS[:DATE_FORMATS.index(dominant)]):
+        hits = parsed.notna()
+        earlier = pd.to_datetime(strings[hits], format=fmt, errors='coerce').dropna()
+        parsed[earlier.index] = earlier
+
+    # Leftovers walk the remaining formats in priority order
+    for fmt in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        if fmt == dominant:
+            continue
+        attempt = pd.to_datetime(strings[missing], format=fmt, errors='coerce').dropna()
+        parsed[attempt.index] = attempt
+
+    return parsed
+
+
+def format_date_for_column(data_series, column_name):
+    """Format a date-like column as YYYY/MM/DD.
+
+    Conversion is vectorized over the whole Series: datetime64 columns are formatted
+    directly, strings are parsed with the dominant format detected from a sample, and
+    only values no format matches fall back to format_single_date.
+    """
+    if pd.api.types.is_datetime64_any_dtype(data_series):
+        return data_series.dt.strftime(OUTPUT_DATE_FORMAT)
+
+    result = data_series.astype(object)
+    pending = data_series.notna() & (data_series != "")
+    if not pending.any():
+        return result
+
+    kinds = data_series.map(type)
+    parsed = pd.Series(pd.NaT, index=data_series.index, dtype='datetime64[ns]')
+
+    datetime_mask = pending & kinds.isin([datetime, pd.Timestamp])
+    if datetime_mask.any():
+        parsed[datetime_mask] = pd.to_datetime(data_series[datetime_mask], errors='coerce')
+
+    string_mask = pending & (kinds == str)
+    if string_mask.any():
+        parsed[string_mask] = _parse_date_strings(data_series[string_mask])
+
+    done = parsed.notna()
+    result[done] = parsed[done].dt.strftime(OUTPUT_DATE_FORMAT)
+
+    leftover = pending & ~done
+    if leftover.any():
+        result[leftover] = data_series[leftover].map(format_single_date)
+
+    return result
 
 def is_date_column(column_name):
     """Check if a column name suggests it contains date data"""
     date_keywords = ['date', 'Date', 'DATE', 'time', 'Time', 'TIME']
     return any(keyword in str(column_name) for keyword in date_keywords)
 
-def get_latest_mappings():
+_mapping_cache = {"version": None, "rows": {}, "derived": {}}
+_mapping_cache_lock = threading.Lock()
+
+
+def _query_active_rows(fbdi_module):
+    """Active rows of the active mapping set of every subset, one indexed join"""
+    query = db.session.query(ColumnMapping.template_column, ColumnMapping.raw_column, ColumnMapping.fbdi_subset)\
+        .join(ActiveMappingSet, ActiveMappingSet.mapping_set_id == ColumnMapping.mapping_set_id)\
+        .filter(ColumnMapping.status == 'Y')
+    if fbdi_module:
+        query = query.filter(ActiveMappingSet.fbdi_module == fbdi_module)
+    return [tuple(row) for row in query.order_by(ColumnMapping.created_at.desc()).all()]
+
+
+def _active_mapping_rows(fbdi_module=None):
+    """Active (template_column, raw_column, fbdi_subset) rows, newest first.
+
+    Cached per process and module until the shared mapping_version counter moves,
+    so a hit costs one primary-key lookup instead of a column_mapping query.
+    """
+    version = MappingVersion.current()
+    with _mapping_cache_lock:
+        if _mapping_cache["version"] != version:
+            _mapping_cache.update(version=version, rows={}, derived={})
+        rows = _mapping_cache["rows"].get(fbdi_module)
+    if rows is not None:
+        return version, rows
+
+    rows = _query_active_rows(fbdi_module)
+    with _mapping_cache_lock:
+        if _mapping_cache["version"] == version:
+            _mapping_cache["rows"][fbdi_module] = rows
+    return version, rows
+
+
+def _cached_derived(key, fbdi_module, build):
+    """Memoize a value built from the active rows for the current mapping version"""
+    version, rows = _active_mapping_rows(fbdi_module)
+    key = (fbdi_module, key)
+    with _mapping_cache_lock:
+        if _mapping_cache["version"] == version and key in _mapping_cache["derived"]:
+            return _mapping_cache["derived"][key]
+    value = build(rows)
+    with _mapping_cache_lock:
+        if _mapping_cache["version"] == version:
+            _mapping_cache["derived"][key] = value
+    return value
+
+
+def clear_mapping_cache():
+    with _mapping_cache_lock:
+        _mapping_cache.update(version=None, rows={}, derived={})
+
+
+def bump_mapping_version():
+    """Mark mappings changed for every process; call before committing a column_mapping write"""
+    MappingVersion.bump()
+
+
+def _is_primary_row(fbdi_subset, sheet_names, primary_sheet):
+    """Rows saved for the primary sheet, or for no particular sheet of the template"""
+    return fbdi_subset == primary_sheet or fbdi_subset not in sheet_names
+
+def get_latest_mappings(fbdi_module=None, sheet_names=None, primary_sheet=None):
+    """Active mappings as {template column: raw column}, for one module or all of them.
+
+    Given the template's sheet_names and primary_sheet, only mappings for the primary
+    sheet are returned, as get_sheet_mappings assigns them; mappings saved for the
+    template's other sheets would otherwise overwrite same-named lines columns.
+    """
+    sheet_names = tuple(sheet_names or ())
     try:
-        mappings = ColumnMapping.query.filter(ColumnMapping.status == 'Y')\
-            .order_by(ColumnMapping.created_at.desc()).all()
-        mapping_dict = {m.template_column: m.raw_column for m in mappings}
-        return mapping_dict
+        mapping_dict = _cached_derived(
+            ("latest", sheet_names, primary_sheet),
+            fbdi_module,
+            lambda rows: {
+                template_column: raw_column for template_column, raw_column, fbdi_subset in rows
+                if not sheet_names or _is_primary_row(fbdi_subset, sheet_names, primary_sheet)
+            }
+        )
+        return dict(mapping_dict)
     except Exception as e:
+        # An empty dict would silently generate unmapped FBDI files
         print(f"Error getting mappings: {e}")
-        return {}
+        raise
+
+def _build_sheet_mappings(rows, sheet_names, primary_sheet):
+    sheet_mappings = {name: {} for name in sheet_names}
+    for template_column, raw_column, fbdi_subset in rows:
+        if _is_primary_row(fbdi_subset, sheet_names, primary_sheet):
+            sheet_mappings[primary_sheet][template_column] = raw_column
+        else:
+            sheet_mappings[fbdi_subset][template_column] = raw_column
+    return sheet_mappings
+
+def get_sheet_mappings(sheet_names, primary_sheet, fbdi_module=None):
+    """Active mappings for each template sheet, fetched in one query.
+
+    Each sheet sees the mappings whose fbdi_subset names it. The primary (lines)
+    sheet also sees mappings saved for a subset that is not one of the template's
+    sheets (e.g. the module name, as older mapping runs stored it).
+    """
+    try:
+        sheet_names = tuple(sheet_names)
+        sheet_mappings = _cached_derived(
+            ("sheets", sheet_names, primary_sheet),
+            fbdi_module,
+            lambda rows: _build_sheet_mappings(rows, sheet_names, primary_sheet)
+        )
+    except Exception as e:
+        print(f"Error getting mappings: {e}")
+        raise
+
+    return {name: dict(mapping) for name, mapping in sheet_mappings.items()}
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_and_hash(source, target):
+    """Copy a readable stream into a writable file and return the hex SHA-256 of the bytes copied"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+        digest.update(block)
+        target.write(block)
+    return digest.hexdigest()